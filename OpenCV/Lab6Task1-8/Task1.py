@@ -1,6 +1,14 @@
 #Load task1.mp4 and display it in an OpenCV window.
 
 import cv2
+import os
+import sys
+
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, parse_args
+
+display = Display.from_args(parse_args("Play task1.mp4"), delay=25)
 
 video_path = 'task1.mp4'
 cap = cv2.VideoCapture(video_path)
@@ -15,10 +23,10 @@ while True:
         print("Reached the end of the video.")
         break
 
-    cv2.imshow('Video Playback', frame)
+    display.show('Video Playback', frame)
 
-    if cv2.waitKey(25) & 0xFF == ord('q'):
+    if display.wait() == ord('q'):
         break
 
 cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+display.close()
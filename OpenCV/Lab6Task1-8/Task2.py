@@ -1,36 +1,34 @@
 #Load task1.mp4, convert it to grayscale, and save as task2.mp4.
 
-import cv2
+import os
+import sys
+
+# The shared video pipeline lives one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, parse_args
+from video_pipeline import VideoPipeline, grayscale
+
+display = Display.from_args(parse_args("Convert task1.mp4 to grayscale"), delay=25)
 
 video_path = 'task1.mp4'
 output_path = 'task2.mp4'
 
-cap = cv2.VideoCapture(video_path)
+def show(gray_frame):
+    display.show('Grayscale Video', gray_frame)
+    # Returning False stops the pipeline when 'q' is pressed
+    return display.wait() != ord('q')
 
-if not cap.isOpened():
+# Decode, convert and encode run on separate threads connected by bounded queues
+pipeline = VideoPipeline(video_path, output_path, grayscale, is_color=False)
+
+try:
+    pipeline.run(preview=show)
+except IOError:
     print("Error: Could not open video.")
     exit()
 
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-fps = cap.get(cv2.CAP_PROP_FPS)
-width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-out = cv2.VideoWriter(output_path, fourcc, fps, (width, height), isColor=False)
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Reached the end of the video.")
-        break
-
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    out.write(gray_frame)
-    cv2.imshow('Grayscale Video', gray_frame)
-
-    if cv2.waitKey(25) & 0xFF == ord('q'):
-        break
+if pipeline.reached_end:
+    print("Reached the end of the video.")
+pipeline.print_stats()
 
-cap.release()
-out.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+display.close(summary=False)
@@ -2,6 +2,14 @@
 #moving progress bar on the bottom of the video preview
 
 import cv2
+import os
+import sys
+
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, parse_args
+
+display = Display.from_args(parse_args("Play task1.mp4 with a progress bar"), delay=25)
 
 video_path = 'task1.mp4'
 cap = cv2.VideoCapture(video_path)
@@ -26,10 +34,10 @@ while True:
     # Draw the progress bar at the bottom of the frame
     cv2.rectangle(frame, (0, height - 20), (progress, height - 5), (0, 255, 0), -1)
 
-    cv2.imshow('Video with Progress Bar', frame)
+    display.show('Video with Progress Bar', frame)
 
-    if cv2.waitKey(25) & 0xFF == ord('q'):
+    if display.wait() == ord('q'):
         break
 
 cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+display.close()
\ No newline at end of file
@@ -1,38 +1,48 @@
 #Load task1.mp4, run Gaussian blur on the video and save as task4.mp4.
 
-import cv2
+import argparse
+import os
+import sys
+
+# The shared video pipeline lives one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chunked_runner import run_chunked
+from display import Display, add_arguments
+from video_pipeline import VideoPipeline, gaussian_blur
+
+parser = add_arguments(argparse.ArgumentParser(description="Blur task1.mp4"))
+parser.add_argument('--chunks', type=int, default=0,
+                    help="blur frame ranges in this many parallel worker processes (no preview)")
+args = parser.parse_args()
+display = Display.from_args(args, delay=25)
 
 video_path = 'task1.mp4'
 output_path = 'task4.mp4'
 
-cap = cv2.VideoCapture(video_path)
-
-if not cap.isOpened():
-    print("Error: Could not open video.")
+# Chunked mode: worker processes blur frame ranges, written in order to one output
+if args.chunks > 1:
+    result = run_chunked(video_path, output_path, 'blur', args.chunks)
+    print(f"Blurred {result['frames']} frames with {result['chunks']} workers "
+          f"({result['frames'] / result['seconds']:.1f} fps)")
     exit()
 
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-fps = cap.get(cv2.CAP_PROP_FPS)
-width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+def show(blurred_frame):
+    display.show('Blurred Video', blurred_frame)
+    # Returning False stops the pipeline when 'q' is pressed
+    return display.wait() != ord('q')
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Reached the end of the video.")
-        break
+# Blurring is the slow stage here, so it gets one worker thread per spare core
+workers = max(1, (os.cpu_count() or 1) - 2)
+pipeline = VideoPipeline(video_path, output_path, gaussian_blur, workers=workers)
 
-    blurred_frame = cv2.GaussianBlur(frame, (15, 15), 0)
-    out.write(blurred_frame)
-
-    
-    cv2.imshow('Blurred Video', blurred_frame)
+try:
+    pipeline.run(preview=show)
+except IOError:
+    print("Error: Could not open video.")
+    exit()
 
-    if cv2.waitKey(25) & 0xFF == ord('q'):
-        break
+if pipeline.reached_end:
+    print("Reached the end of the video.")
+pipeline.print_stats()
 
-cap.release()
-out.release()
-cv2.destroyAllWindows() 
\ No newline at end of file
+display.close(summary=False)
@@ -1,46 +1,53 @@
 #Use the Raspberry Pi camera to capture a video and save it as task5.mp4. Use q to end
 #the recording.
 
+import argparse
 import cv2
-from picamera2 import Picamera2
-import time
+import os
+import sys
 
-# Initialize the camera
-picam2 = Picamera2()
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, add_arguments
+from frame_source import add_source_arguments, open_source
 
-# Configure the camera to capture video at 640x480 resolution
-config = picam2.create_video_configuration(main={"size": (640, 480)})
-picam2.configure(config)
+parser = add_source_arguments(add_arguments(argparse.ArgumentParser(description="Record the Pi camera to task5.mp4")))
+args = parser.parse_args()
+display = Display.from_args(args, delay=1)
 
-# Start the camera with a small delay to allow it to initialize
-picam2.start()
-time.sleep(2)  # Waits for 2 seconds
+# Initialize the camera (or --source) to capture video at 640x480 resolution, and give
+# the camera 2 seconds to initialize
+source = open_source(args.source, size=(640, 480), video=True, realtime=args.realtime,
+                     warmup=2)
 
 # Set up video writer with MP4 codec to save the video file
 fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-out = cv2.VideoWriter('/home/pi/ee347/lab-6-python-and-opencv-2-group-17/task5.mp4', fourcc, 30, (640, 480))
+out = cv2.VideoWriter('/home/pi/ee347/lab-6-python-and-opencv-2-group-17/task5.mp4', fourcc, 30, source.size)
 
 print("Press 'q' to stop recording...")
 
 # Main loop for capturing and saving video frames
 while True:
     # Capture a frame from the camera
-    frame = picam2.capture_array()
+    ret, frame = source.read()
+    if not ret:
+        break
 
-    # Convert the frame from RGB to BGR format (required for OpenCV compatibility)
-    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    # Convert the frame from RGB to BGR format (required for OpenCV compatibility),
+    # recorded files are already BGR
+    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) if source.live else frame
 
     # Write the frame to the output video file
     out.write(frame_bgr)
 
     # Display the frame in an OpenCV window
-    cv2.imshow('Camera Capture', frame)
+    display.show('Camera Capture', frame)
 
     # Stop recording if 'q' key is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
+    if display.wait() == ord('q'):
         break
 
 # Release the video writer and close all windows after recording stops
 out.release()
-cv2.destroyAllWindows()
-picam2.stop()
+display.close()
+source.release()
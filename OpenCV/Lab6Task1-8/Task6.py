@@ -1,57 +1,64 @@
 #Copy the code from task 5 and save the video as a numpy file. Ensure the storage space
 #used is minimised without loss of data.
+#Frames are streamed into a chunked, zlib compressed archive (see frame_archive.py)
+#instead of being kept in a list, so memory use stays flat for any recording length.
+#The camera mostly watches a static scene, so each chunk stores one keyframe and then
+#only the differences between frames.
 
+import argparse
 import cv2
-from picamera2 import Picamera2, Preview
-import numpy as np
-import time
+import os
+import sys
 
-# Initialize the camera
-picam2 = Picamera2()
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, add_arguments
+from frame_archive import FrameRecorder
+from frame_source import add_source_arguments, open_source
 
-# Configure the camera to preview at 640x480 resolution
-camera_config = picam2.create_preview_configuration(main={"size": (640, 480)})
-picam2.configure(camera_config)
+parser = add_source_arguments(add_arguments(argparse.ArgumentParser(description="Record the Pi camera to task6.frames")))
+args = parser.parse_args()
+display = Display.from_args(args, delay=100)
 
-# Start the camera and wait a moment to ensure it's fully initialized
-picam2.start()
-time.sleep(2)  # Delay to allow the camera to adjust
+# Initialize the camera (or --source) to preview at 640x480 resolution, and wait a
+# moment to ensure it's fully initialized
+source = open_source(args.source, size=(640, 480), realtime=args.realtime, warmup=2)
 
 # Set frame dimensions
-frame_width = 640
-frame_height = 480
-
-# Initialize an empty list to store captured frames
-frames = []
-
-# Capture loop
-while True:
-    # Capture a frame from the camera
-    frame = picam2.capture_array()
-
-    # Rotate the frame 180 degrees
-    frame = cv2.rotate(frame, cv2.ROTATE_180)
-
-    # Convert the frame from RGB to BGR format for OpenCV compatibility
-    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-    # Append the processed frame to the list of frames
-    frames.append(frame)
-
-    # Display the frame in an OpenCV window
-    cv2.imshow("Task 6", frame)
-
-    # Break the loop if 'q' is pressed
-    if cv2.waitKey(100) & 0xFF == ord('q'):
-        break
-
-# Convert the list of frames to a numpy array for saving
-frames_array = np.array(frames, dtype=np.uint8)
-
-# Save the frames array to a file in .npy format
-np.save("task6.npy", frames_array)
+frame_width, frame_height = source.size
+
+# Open the compressed recording, frames are written in chunks of 30 as they arrive.
+# The with block writes the last chunk and the index even if the loop is interrupted
+# (Ctrl+C or an error), so task6.frames can always be read back.
+with FrameRecorder("task6.frames", chunk_frames=30, delta=True) as recorder:
+    # Capture loop
+    while True:
+        # Capture a frame from the camera
+        ret, frame = source.read()
+        if not ret:
+            break
+
+        # Rotate the frame 180 degrees and convert it from RGB to BGR format for OpenCV
+        # compatibility, recorded files are already the right way up and BGR
+        if source.live:
+            frame = cv2.rotate(frame, cv2.ROTATE_180)
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+        # Add the processed frame to the recording
+        recorder.write(frame)
+
+        # Display the frame in an OpenCV window
+        display.show("Task 6", frame)
+
+        # Break the loop if 'q' is pressed
+        if display.wait() == ord('q'):
+            break
+
+# Report how much space was saved
+print(f"Saved {recorder.frames} frames to task6.frames, "
+      f"compression ratio {recorder.ratio():.2f}:1")
 
 # Stop the camera and close all OpenCV windows
-picam2.stop()
-cv2.destroyAllWindows()
+source.release()
+display.close()
 
@@ -1,10 +1,36 @@
 #Load task1.mp4 and use haarcascades to detect all faces in the video. Draw a bounding
 #box around the faces and display the output in a preview window
 
+import argparse
 import cv2
+import os
+import sys
+
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, add_arguments
+from face_detection import DetectionScheduler, load_face_cascade
+
+parser = add_arguments(argparse.ArgumentParser(description="Detect faces in task1.mp4"))
+parser.add_argument('--detect-every', type=int, default=5,
+                    help="run the full cascade every N frames and track faces in between (1 = every frame)")
+parser.add_argument('--detect-scale', type=float, default=2.0,
+                    help="downscale factor for the full cascade pass (1 = full resolution)")
+args = parser.parse_args()
+display = Display.from_args(args, delay=25)
 
 # Load the Haar Cascade for face detection
-faceCascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+faceCascade = load_face_cascade()
+
+# Run the full cascade only every few frames, tracking the faces in between
+scheduler = DetectionScheduler(
+    faceCascade,
+    interval=args.detect_every,
+    scale=args.detect_scale,
+    scaleFactor=1.05,      # Parameter for adjusting scale to detect faces of different sizes
+    minNeighbors=5,        # Minimum number of neighbors for each rectangle to be considered a face
+    minSize=(60, 60)       # Minimum size of the face to detect
+)
 
 # Specify the input video file
 inputVid = "task1.mp4"
@@ -30,25 +56,21 @@ while True:
     # Convert the frame to grayscale (required for face detection)
     greyFrame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # Detect faces in the grayscale frame
-    faces = faceCascade.detectMultiScale(
-        greyFrame,
-        scaleFactor=1.05,      # Parameter for adjusting scale to detect faces of different sizes
-        minNeighbors=5,        # Minimum number of neighbors for each rectangle to be considered a face
-        minSize=(60, 60)       # Minimum size of the face to detect
-    )
+    # Detect (or track) faces in the grayscale frame
+    faces = scheduler.update(greyFrame)
 
     # Draw a green rectangle around each detected face
     for (x, y, w, h) in faces:
         cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
 
     # Display the frame with detected faces
-    cv2.imshow("Task 9", frame)
+    display.show("Task 9", frame)
 
     # Exit if the 'q' key is pressed
-    if cv2.waitKey(25) & 0xFF == ord('q'):
+    if display.wait() == ord('q'):
         break
 
 # Release the video capture object and close all OpenCV windows
 cap.release()
-cv2.destroyAllWindows()
+display.close()
+print(f"Full cascade ran on {scheduler.full_detections} of {scheduler.frames} frames")
@@ -4,34 +4,46 @@
 #display the cropped face
 
 
+import argparse
 import cv2
-from picamera2 import Picamera2
+import os
+import sys
 
-# Initialize the camera
-picam2 = Picamera2()
+# The shared display helpers live one directory up, in OpenCV/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from display import Display, add_arguments
+from face_detection import detect_faces_scaled, load_face_cascade
+from frame_source import add_source_arguments, open_source
 
-# Configure the camera preview to 640x480 resolution with the XRGB8888 format
-camera_config = picam2.create_preview_configuration(main={"format": 'XRGB8888', "size": (640, 480)})
-picam2.configure(camera_config)
-picam2.start()
+parser = add_source_arguments(add_arguments(argparse.ArgumentParser(description="Detect and crop one face from the Pi camera")))
+args = parser.parse_args()
+display = Display.from_args(args, delay=25)
+
+# Initialize the camera (or --source) preview at 640x480 resolution with the XRGB8888 format
+source = open_source(args.source, size=(640, 480), format='XRGB8888', realtime=args.realtime)
 
 # Load the Haar Cascade model for face detection
-faceCascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+faceCascade = load_face_cascade()
 
 # Main loop to capture frames and detect faces
 while True:
     # Capture a frame from the camera
-    frame = picam2.capture_array()
+    ret, frame = source.read()
+    if not ret:
+        break
 
-    # Rotate the frame 180 degrees
-    frame = cv2.rotate(frame, cv2.ROTATE_180)
+    # Rotate the frame 180 degrees (recorded files are already the right way up). Either
+    # way this gives a new frame we can draw on, source frames may be read-only.
+    frame = cv2.rotate(frame, cv2.ROTATE_180) if source.live else frame.copy()
 
     # Convert the frame to grayscale for face detection
     greyFrame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # Detect faces in the grayscale frame
-    faces = faceCascade.detectMultiScale(
+    # Detect faces on a half-size copy of the grayscale frame, boxes come back at full size
+    faces = detect_faces_scaled(
+        faceCascade,
         greyFrame,
+        scale=2.0,
         scaleFactor=1.05,        # Scale factor to adjust face detection sensitivity
         minNeighbors=5,          # Minimum neighbors needed for a rectangle to qualify as a face
         minSize=(100, 100)       # Minimum size of faces to detect
@@ -53,15 +65,15 @@ while True:
         face_crop = frame[y:y + h, x:x + w]
 
         # Display the cropped face in a separate window
-        cv2.imshow('Face', face_crop)
+        display.show('Face', face_crop)
 
     # Display the main frame with face detection in a window named "Task 8"
-    cv2.imshow("Task 8", frame)
+    display.show("Task 8", frame)
 
     # Exit the loop if 'q' key is pressed
-    if cv2.waitKey(25) & 0xFF == ord('q'):
+    if display.wait() == ord('q'):
         break
 
 # Cleanup: Stop the camera and close all OpenCV windows
-picam2.stop()
-cv2.destroyAllWindows()
+source.release()
+display.close()
@@ -6,25 +6,62 @@
 
 
 
+import argparse
 import cv2
-from picamera2 import Picamera2
 import numpy as np
 import time
 import os
+import threading
 from datetime import datetime
 
+from alloc_counter import AllocationCounter
+from async_writer import AsyncVideoWriter
+from capture_ring import CaptureThread
+from display import Display, add_arguments
+from frame_source import add_source_arguments, open_source
+from motion import MotionDetector, MotionTrigger
+from overlay import StaticOverlay
+from preroll import PreRollBuffer
+import tracing
+from tracing import tracer
+
 class CameraApp:
-    def __init__(self):
-        # Initialize camera
-        self.picam2 = Picamera2()
-        self.picam2.preview_configuration.main.size = (1280, 720)
-        self.picam2.preview_configuration.main.format = "RGB888"
-        self.picam2.configure("preview")
-        self.picam2.start()
+    def __init__(self, display=None, source=None, preroll_seconds=3.0):
+        # Preview window and key handling (headless when run with --headless)
+        self.display = display if display is not None else Display(delay=25)
+
+        # Initialize camera (or any other frame source, see frame_source.py)
+        if source is None:
+            source = open_source("picamera", size=(1280, 720), format="RGB888")
+        self.source = source
+        # The camera is mounted upside down, recorded files are already the right way up
+        rotate = cv2.ROTATE_180 if source.live else None
+
+        # Capture runs on its own thread into a ring of preallocated frames that the
+        # display reads at its own rate, plus a grey copy of each frame for motion
+        # detection, and feeds the recording writer's queue
+        self.capture = CaptureThread(source, slots=8, rotate=rotate, grey=True)
+        height, width = self.capture.ring.frames.shape[1:3]
+        self.frame_size = (width, height)
+        self.display_reader = self.capture.ring.reader("display")
+
+        # The last few seconds before 'r' is pressed, JPEG encoded and capped in bytes
+        self.preroll = PreRollBuffer(self.capture.ring.reader("preroll"),
+                                     seconds=preroll_seconds, max_bytes=32 * 1024 * 1024)
+
+        # Motion-triggered recording, checked on every grey frame at a small size
+        self.motion_reader = self.capture.grey_ring.reader("motion")
+        self.motion_detector = MotionDetector(width=160)
+        self.motion_trigger = MotionTrigger(min_area=0.01, keep_area=0.005, start_frames=3,
+                                            stop_seconds=3.0, cooldown=5.0)
+        self.motion_mode = False
+        self.motion_thread = None
+        self.motion_event = None  # "start"/"stop" for the main loop to act on
 
         # Initialize recording variables
         self.is_recording = False
         self.output_video = None
+        self.record_policy = "drop_oldest"  # What the writer does when its queue is full
         self.start_time = None
 
         # Create output directories if they don't exist
@@ -33,9 +70,38 @@ class CameraApp:
         os.makedirs(self.image_dir, exist_ok=True)
         os.makedirs(self.video_dir, exist_ok=True)
 
+        # Instructions never change, so they are drawn once and blended onto each frame
+        self.overlay = StaticOverlay(self.draw_static_ui)
+        self.alloc_counter = None  # AllocationCounter when run with --count-allocs
+
         # Window name
         self.window_name = "Camera App"
-        cv2.namedWindow(self.window_name)
+        self.display.named_window(self.window_name)
+
+    def motion_loop(self):
+        """Check every captured frame for motion and queue start/stop events"""
+        while self.motion_mode:
+            frame = self.motion_reader.read(timeout=0.1)
+            if frame is None and self.motion_reader.closed():
+                break
+            if frame is not None:
+                with tracer.stage("motion.detect"):
+                    fraction = self.motion_detector.detect(frame)
+                event = self.motion_trigger.update(fraction)
+                if event is not None:
+                    self.motion_event = event
+
+    def set_motion_mode(self, enabled):
+        """Start or stop the motion detection thread"""
+        self.motion_mode = enabled
+        if enabled:
+            self.motion_reader.skip_to_latest()
+            self.motion_thread = threading.Thread(target=self.motion_loop, name="motion", daemon=True)
+            self.motion_thread.start()
+        elif self.motion_thread is not None:
+            self.motion_thread.join()
+            self.motion_thread = None
+            self.motion_event = None
 
     def generate_filename(self, file_type):
         """Generate unique filename based on timestamp"""
@@ -45,6 +111,18 @@ class CameraApp:
         else:  # video
             return os.path.join(self.video_dir, f"video_{timestamp}.mp4")
 
+    def draw_static_ui(self, canvas):
+        """Draw the UI elements that never change, once, for the overlay"""
+        instructions = [
+            "Press 'r' to start/stop recording",
+            "Press 'c' to capture image",
+            "Press 'm' to toggle motion recording",
+            "Press 'q' to quit"
+        ]
+        for i, instruction in enumerate(instructions):
+            cv2.putText(canvas, instruction, (10, canvas.shape[0] - 20 - (i * 30)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
     def draw_ui(self, frame):
         """Draw UI elements on the frame"""
         # Add recording indicator (red circle)
@@ -56,15 +134,13 @@ class CameraApp:
             cv2.putText(frame, duration, (50, 40),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
 
-        # Add instructions
-        instructions = [
-            "Press 'r' to start/stop recording",
-            "Press 'c' to capture image",
-            "Press 'q' to quit"
-        ]
-        for i, instruction in enumerate(instructions):
-            cv2.putText(frame, instruction, (10, frame.shape[0] - 20 - (i * 30)),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        # Add motion mode indicator
+        if self.motion_mode:
+            cv2.putText(frame, "Motion: ON", (frame.shape[1] - 160, 40),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+        # Blend in the pre-rendered instructions
+        self.overlay.apply(frame)
 
         return frame
 
@@ -72,51 +148,86 @@ class CameraApp:
         """Start video recording"""
         filename = self.generate_filename("video")
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.output_video = cv2.VideoWriter(
-            filename, fourcc, 30.0, (1280, 720))
+        # Frames are written on a worker thread so a slow disk never blocks the preview
+        self.output_video = AsyncVideoWriter(
+            filename, fourcc, 30.0, self.frame_size, queue_size=60, policy=self.record_policy,
+            preroll=self.preroll.frames(30.0))
         self.is_recording = True
         self.start_time = time.time()
+
+        # Every captured frame goes to the writer queue, straight from the capture thread
+        self.capture.add_sink(self.output_video.write)
         print(f"Started recording: {filename}")
 
     def stop_recording(self):
         """Stop video recording"""
         if self.output_video is not None:
-            self.output_video.release()
             self.is_recording = False
+            self.capture.remove_sink(self.output_video.write)
+            # Flush everything still queued, then close the file
+            self.output_video.release()
+            print(f"Recording stopped: {self.output_video.stats()}")
             self.output_video = None
-            print("Recording stopped")
 
     def capture_image(self):
         """Capture a single image"""
         filename = self.generate_filename("image")
-        frame = self.picam2.capture_array()
+        frame = self.capture.ring.snapshot()
         cv2.imwrite(filename, frame)
         print(f"Image captured: {filename}")
 
+    def frame_stats(self):
+        """Frames captured, and frames read, dropped and stale for each consumer"""
+        stats = {"captured": self.capture.captured}
+        for reader in (self.display_reader, self.preroll.reader, self.motion_reader):
+            stats[reader.name] = reader.stats()
+        stats["preroll_buffer"] = self.preroll.stats()
+        stats["motion_detector"] = self.motion_detector.stats()
+        if self.alloc_counter is not None:
+            stats["allocations"] = self.alloc_counter.stats()
+        if self.output_video is not None:
+            stats["writer"] = self.output_video.stats()
+        return stats
+
     def run(self):
         """Main application loop"""
+        if self.alloc_counter is not None:
+            self.alloc_counter.start()
+            self.capture.alloc_counter = self.alloc_counter
+        self.capture.start()
+        self.preroll.start()
         try:
             while True:
-                # Capture frame
-                frame = self.picam2.capture_array()
-                frame = cv2.rotate(frame, cv2.ROTATE_180)
-                
-                # Create a copy for display (to avoid recording UI elements)
-                display_frame = frame.copy()
-                
-                # Draw UI on display frame
-                display_frame = self.draw_ui(display_frame)
-                
-                # Show frame
-                cv2.imshow(self.window_name, display_frame)
-                
-                # Record frame (without UI elements)
-                if self.is_recording and self.output_video is not None:
-                    self.output_video.write(frame)
-                
+                # Newest captured frame, copied into the display reader's own buffer.
+                # The recording reads its own copy, so the UI can be drawn straight on it.
+                with tracer.stage("display.read"):
+                    frame = self.display_reader.read(timeout=0.1)
+                if frame is None and not self.capture.is_alive():
+                    print("End of frame source")
+                    break
+
+                if frame is not None:
+                    if self.alloc_counter is not None:
+                        self.alloc_counter.begin_frame("display")
+
+                    # Nothing is shown in headless mode, so skip the UI entirely
+                    if not self.display.headless:
+                        # Draw UI straight on the reader's buffer, nothing is allocated
+                        with tracer.stage("display.draw"):
+                            display_frame = self.draw_ui(frame)
+
+                        # Show frame
+                        with tracer.stage("display.imshow"):
+                            self.display.show(self.window_name, display_frame)
+
+                    if self.alloc_counter is not None:
+                        self.alloc_counter.end_frame("display")
+
                 # Handle key presses
-                key = cv2.waitKey(25) & 0xFF
-                
+                with tracer.stage("display.waitKey"):
+                    key = self.display.wait()
+                tracer.tick()
+
                 if key == ord('q'):
                     if self.is_recording:
                         self.stop_recording()
@@ -126,16 +237,57 @@ class CameraApp:
                         self.start_recording()
                     else:
                         self.stop_recording()
-                elif key == ord('c'):
+                elif key == ord('m'):
+                    self.set_motion_mode(not self.motion_mode)
+
+                # Start or stop recording when the motion trigger fired
+                event, self.motion_event = self.motion_event, None
+                if event == "start" and not self.is_recording:
+                    self.start_recording()
+                elif event == "stop" and self.is_recording:
+                    self.stop_recording()
+
+                if key == ord('c'):
                     self.capture_image()
 
         finally:
             # Cleanup
             if self.is_recording:
                 self.stop_recording()
-            self.picam2.stop()
-            cv2.destroyAllWindows()
+            if self.motion_mode:
+                self.set_motion_mode(False)
+            self.preroll.stop()
+            self.capture.stop()
+            self.source.release()
+            self.display.close()
+            if self.alloc_counter is not None:
+                self.alloc_counter.stop()
+            print(f"Frame stats: {self.frame_stats()}")
 
 if __name__ == "__main__":
-    app = CameraApp()
-    app.run()
\ No newline at end of file
+    parser = add_arguments(argparse.ArgumentParser(description="Camera app with video recording and image capture"))
+    add_source_arguments(parser)
+    parser.add_argument('--motion', action='store_true',
+                        help="start in motion-triggered recording mode")
+    parser.add_argument('--preroll', type=float, default=3.0,
+                        help="seconds before 'r' is pressed to include in each recording")
+    parser.add_argument('--count-allocs', action='store_true',
+                        help="trace memory allocated by each frame of the main loop (slow)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args(args)
+    app = CameraApp(Display.from_args(args, delay=25),
+                    open_source(args.source, size=(1280, 720), format="RGB888",
+                                realtime=args.realtime),
+                    preroll_seconds=args.preroll)
+    if args.motion:
+        app.set_motion_mode(True)
+    if args.count_allocs:
+        app.alloc_counter = AllocationCounter()
+    try:
+        app.run()
+    finally:
+        if tracer.enabled:
+            print(tracer.format_summary())
+        if args.trace:
+            print(f"Wrote {tracer.export_trace(args.trace)} trace events to {args.trace}")
\ No newline at end of file
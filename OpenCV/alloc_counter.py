@@ -0,0 +1,65 @@
+#Per-frame memory allocation counter for CameraApp, built on tracemalloc.
+#tracemalloc sees numpy buffers, and so every array OpenCV returns, as well as Python
+#objects. begin_frame(region)/end_frame(region) bracket the per-frame work of one
+#region and record how far traced memory rose above where the frame started (the
+#transient peak), so a new 1280x720 frame shows up as ~2.7 MB and a zero-allocation
+#path as a few hundred bytes of Python objects. CameraApp measures two regions:
+#   capture  the capture thread: decode, rotate, grey conversion and the sinks
+#            (the recording's queue copy and the face track)
+#   display  the main loop from a new frame to imshow, also run in headless mode
+#tracemalloc's peak is process wide, so brackets hold a lock and never overlap: while
+#counting, the capture and display threads take turns. Anything the pre-roll or
+#detection threads allocate in the same window is still counted, as occasional
+#spikes, so the median is the steady-state figure. Tracing slows everything down, so
+#it is only switched on with --count-allocs.
+
+import statistics
+import threading
+import tracemalloc
+
+
+class AllocationCounter:
+    def __init__(self, warmup=30):
+        self.warmup = warmup  # frames skipped per region while buffers are first allocated
+        self.frames = {}  # region -> frames bracketed
+        self.peaks = {}   # region -> bytes allocated by each frame after warmup
+        self._base = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        tracemalloc.start()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def begin_frame(self, region="frame"):
+        """Start one frame of a region, waiting for any other region's frame to end"""
+        self._lock.acquire()
+        self._base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def end_frame(self, region="frame", keep=True):
+        """End the frame begun last, keep=False discards it (e.g. no frame arrived)"""
+        try:
+            peak = tracemalloc.get_traced_memory()[1]
+            if keep:
+                seen = self.frames.get(region, 0)
+                if seen >= self.warmup:
+                    self.peaks.setdefault(region, []).append(peak - self._base)
+                self.frames[region] = seen + 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Bytes allocated per frame after warmup for each region: median, mean and max"""
+        stats = {}
+        for region in self.frames:
+            peaks = self.peaks.get(region)
+            if not peaks:
+                stats[region] = {"frames": 0}
+                continue
+            stats[region] = {"frames": len(peaks),
+                             "median_bytes": statistics.median(peaks),
+                             "mean_bytes": statistics.fmean(peaks),
+                             "max_bytes": max(peaks)}
+        return stats
@@ -0,0 +1,155 @@
+#cv2.VideoWriter running on its own thread behind a bounded queue.
+#write() copies the frame into one of a fixed set of preallocated buffers and returns
+#straight away, and a worker thread does the slow cv2.VideoWriter.write, so a stalled
+#SD card or disk never holds up the caller. When the queue is full the policy decides
+#what happens:
+#   block        wait for the writer to catch up (no frames lost)
+#   drop_oldest  discard the oldest queued frame to make room (keeps the newest)
+#   drop_newest  discard the incoming frame
+#release() writes everything still queued before closing the file.
+#Frames passed as preroll (e.g. PreRollBuffer.frames(fps)) are written first, on the
+#worker thread, while live frames queue up behind them. Until the pre-roll is written
+#the queue may hold up to len(preroll) frames more than queue_size before the policy
+#applies, so the first live frames after the trigger are not dropped while the writer
+#is busy with the pre-roll. The extra room is capped at preroll_bytes of raw frames
+#(the pre-roll buffer's own cap by default), and buffers beyond queue_size are freed
+#again as the queue drains after the flush.
+
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from tracing import tracer
+
+POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class AsyncVideoWriter:
+    def __init__(self, filename, fourcc, fps, size, is_color=True, queue_size=60,
+                 policy="drop_oldest", preroll=None, preroll_bytes=32 * 1024 * 1024):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', choose from {', '.join(POLICIES)}")
+        self.filename = filename
+        self.queue_size = queue_size
+        self.policy = policy
+        self.writer = cv2.VideoWriter(filename, fourcc, fps, size, isColor=is_color)
+
+        self._queue = deque()
+        self._free = []  # buffers not currently queued or being written
+        self._cond = threading.Condition()
+        self._closing = False
+        self._preroll = preroll
+        self._preroll_room = 0
+        if preroll is not None:
+            frame_bytes = size[0] * size[1] * (3 if is_color else 1)
+            self._preroll_room = min(len(preroll), preroll_bytes // frame_bytes)
+
+        # Stats
+        self.queued = 0
+        self.written = 0
+        self.preroll_written = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def _buffer_for(self, frame):
+        """Take a free buffer, allocating one while fewer than queue_size + 1 exist"""
+        if self._free:
+            buffer = self._free.pop()
+            if buffer.shape == frame.shape and buffer.dtype == frame.dtype:
+                return buffer
+        return np.empty_like(frame)
+
+    def write(self, frame):
+        """Queue a copy of frame for writing. Returns False if a frame was dropped."""
+        with self._cond:
+            if self._closing:
+                raise ValueError("write() after release()")
+            dropped = False
+            if len(self._queue) >= self._limit():
+                if self.policy == "block":
+                    self._cond.wait_for(lambda: len(self._queue) < self._limit())
+                elif self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                else:  # drop_oldest
+                    self._free.append(self._queue.popleft())
+                    self.dropped += 1
+                    dropped = True
+
+            buffer = self._buffer_for(frame)
+            np.copyto(buffer, frame)
+            self._queue.append(buffer)
+            self.queued += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+            return not dropped
+
+    def _limit(self):
+        """Queue length at which the policy applies, raised while the pre-roll is written"""
+        return self.queue_size + self._preroll_room
+
+    def _timed_write(self, frame):
+        start = time.perf_counter()
+        with tracer.stage("writer.write"):
+            self.writer.write(frame)
+        elapsed = time.perf_counter() - start
+        self.write_seconds += elapsed
+        self.max_write_seconds = max(self.max_write_seconds, elapsed)
+
+    def _run(self):
+        if self._preroll is not None:
+            for frame in self._preroll:
+                self._timed_write(frame)
+                self.preroll_written += 1
+            with self._cond:
+                self._preroll = None
+                self._preroll_room = 0
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closing)
+                if not self._queue:
+                    return  # closing and fully flushed
+                buffer = self._queue.popleft()
+                self._cond.notify_all()
+
+            self._timed_write(buffer)
+
+            with self._cond:
+                # Keep at most queue_size + 1 buffers once the pre-roll room is gone
+                if len(self._free) + len(self._queue) < self._limit():
+                    self._free.append(buffer)
+                self.written += 1
+
+    def depth(self):
+        return len(self._queue)
+
+    def release(self):
+        """Write every queued frame, then close the file"""
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.writer.release()
+
+    def stats(self):
+        """Queue depth, drops and write latency so far"""
+        writes = self.written + self.preroll_written
+        return {"queued": self.queued, "written": self.written,
+                "preroll_written": self.preroll_written, "dropped": self.dropped,
+                "depth": self.depth(), "max_depth": self.max_depth,
+                "mean_write_ms": 1000 * self.write_seconds / writes if writes else 0.0,
+                "max_write_ms": 1000 * self.max_write_seconds}
@@ -0,0 +1,148 @@
+#Run one of the Lab 6 video operations over many files at once.
+#Input videos come from a directory or a manifest file (one path per line) and are
+#spread across a ProcessPoolExecutor with one process per CPU. Each output is written
+#to a temporary file and only renamed into place once it is complete, so a rerun
+#after a crash skips finished files and redoes the rest. A JSON report records the
+#timing of every file. Output names carry a short hash of the full input path, so
+#two inputs called clip.mp4 in different directories don't share an output.
+#
+#   python batch_runner.py videos/ --op blur --output-dir blurred --report report.json
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from frame_archive import ARCHIVE_EXTENSIONS
+from video_pipeline import VideoPipeline, detect_faces, gaussian_blur, grayscale
+
+# Operation name -> (per-frame transform, colour output)
+OPERATIONS = {
+    "grayscale": (grayscale, False),
+    "blur": (gaussian_blur, True),
+    "face-detect": (detect_faces, True),
+}
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv") + ARCHIVE_EXTENSIONS
+
+
+def list_inputs(source):
+    """Return the input videos from a directory or a manifest file"""
+    if os.path.isdir(source):
+        names = sorted(os.listdir(source))
+        return [os.path.join(source, name) for name in names
+                if name.lower().endswith(VIDEO_EXTENSIONS)]
+
+    # Manifest: one path per line, relative paths are relative to the manifest
+    base_dir = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                inputs.append(os.path.join(base_dir, line))
+    return inputs
+
+
+def output_path_for(input_path, output_dir, op):
+    """e.g. clip_1a2b3c4d_blur.mp4, the hash is of the absolute input path"""
+    input_path = os.path.abspath(input_path)
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    digest = hashlib.sha1(input_path.encode()).hexdigest()[:8]
+    return os.path.join(output_dir, f"{stem}_{digest}_{op}.mp4")
+
+
+def process_file(input_path, output_path, op):
+    """Run one operation on one video. Executed in a worker process."""
+    transform, is_color = OPERATIONS[op]
+    # Write under a temporary name so that a partial file never looks complete
+    partial_path = output_path[:-len(".mp4")] + ".partial.mp4"
+    start = time.perf_counter()
+    try:
+        pipeline = VideoPipeline(input_path, partial_path, transform, is_color=is_color)
+        stats = pipeline.run()
+        os.replace(partial_path, output_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return {"input": input_path, "output": output_path, "status": "failed",
+                "error": str(e), "seconds": time.perf_counter() - start}
+
+    seconds = time.perf_counter() - start
+    return {"input": input_path, "output": output_path, "status": "done",
+            "frames": stats["total"]["frames"], "seconds": seconds,
+            "fps": stats["total"]["fps"],
+            "stage_fps": {name: stats[name]["fps"] for name in ("read", "transform", "write")}}
+
+
+def run_batch(inputs, output_dir, op, jobs=None, report_path=None):
+    """Process every input with a pool of worker processes and return the report"""
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{op}', choose from {', '.join(OPERATIONS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+
+    # Keep the timings of files finished by an earlier run of the same report,
+    # keyed by full input path
+    previous = {}
+    if report_path and os.path.exists(report_path):
+        with open(report_path) as f:
+            previous = {os.path.abspath(r["input"]): r for r in json.load(f).get("files", [])
+                        if r["status"] in ("done", "skipped")}
+
+    results = []
+    todo = []
+    # The same file listed twice in a manifest is only processed once
+    inputs = list(dict.fromkeys(os.path.abspath(i) for i in inputs))
+    for input_path in inputs:
+        output_path = output_path_for(input_path, output_dir, op)
+        record = previous.get(input_path)
+        # Outputs are only renamed into place once complete, and an output from a
+        # report must have been made from this input
+        if os.path.exists(output_path) and (record is None or record["output"] == output_path):
+            result = dict(record or {}, input=input_path, output=output_path)
+            result["status"] = "skipped"
+            results.append(result)
+        else:
+            todo.append((input_path, output_path))
+
+    print(f"{len(todo)} to process, {len(results)} already complete, {jobs} processes")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(process_file, i, o, op) for i, o in todo]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(inputs)}] {result['status']}: {result['input']}")
+            # Rewrite the report as we go so a crash still leaves the timings so far
+            if report_path:
+                write_report(report_path, op, results, time.perf_counter() - start)
+
+    report = write_report(report_path, op, results, time.perf_counter() - start)
+    done = [r for r in results if r["status"] == "done"]
+    frames = sum(r["frames"] for r in done)
+    print(f"Processed {len(done)} files ({frames} frames) in {report['seconds']:.1f} s")
+    return report
+
+
+def write_report(report_path, op, results, seconds):
+    report = {"operation": op, "seconds": seconds, "files": results}
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch process videos with a Lab 6 operation")
+    parser.add_argument("source", help="directory of videos or a manifest file")
+    parser.add_argument("--op", choices=sorted(OPERATIONS), default="grayscale")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--report", default="batch_report.json")
+    args = parser.parse_args()
+
+    run_batch(list_inputs(args.source), args.output_dir, args.op, args.jobs, args.report)
@@ -0,0 +1,294 @@
+#Deterministic benchmark suite for the Lab 6 video pipelines.
+#Test clips are generated locally from a fixed seed (a smooth textured scene with
+#moving shapes, and the same scene with drawn faces that the Haar cascade detects), so
+#every machine benchmarks the same frames. Each benchmark runs headless in its own
+#process, so peak RSS belongs to that benchmark alone, and records:
+#   fps           frames delivered per second of wall time
+#   p50/p99 ms    time between consecutive output frames
+#   peak RSS      resource.getrusage ru_maxrss of the benchmark process
+#   CPU %         user+system CPU time over wall time (100% = one core busy)
+#For Lab6task9 and lab6task10 the frame times are iterations of the display loop, which
+#also counts loops that found no new frame. Next to them each records what reached the
+#recording: frames captured, frames the AsyncVideoWriter wrote (written fps) and
+#dropped, and the stale and dropped reads of the display's ring reader.
+#Results are written as JSON. --compare flags every benchmark whose fps fell, or whose
+#latency or peak RSS rose, by more than --threshold between two result files.
+#
+#   python benchmark.py --out before.json
+#   python benchmark.py --out after.json
+#   python benchmark.py --compare before.json after.json
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from display import Display
+from frame_source import VideoFileSource
+from video_pipeline import VideoPipeline, detect_faces, gaussian_blur, grayscale
+
+CLIP_SIZE = (1280, 720)
+CLIP_FRAMES = 150
+SEED = 347
+
+# Metrics checked by --compare, and whether a higher value is better
+CHECKS = {"fps": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False,
+          "written_fps": True, "writer_dropped": False}
+
+
+#------------------------------------------------#
+#   Synthetic test clips
+#------------------------------------------------#
+
+def draw_face(img, cx, cy, size):
+    """Draw a simple frontal face, centred on (cx, cy), that Haar cascades detect"""
+    s = size
+    cv2.ellipse(img, (cx, cy), (int(s * 0.42), int(s * 0.55)), 0, 0, 360, (150, 175, 215), -1)
+    cv2.ellipse(img, (cx, cy - int(s * 0.35)), (int(s * 0.45), int(s * 0.25)), 0, 180, 360,
+                (40, 40, 60), -1)
+    for side in (-1, 1):
+        ex, ey = cx + side * int(s * 0.17), cy - int(s * 0.1)
+        cv2.ellipse(img, (ex, ey - int(s * 0.09)), (int(s * 0.1), int(s * 0.025)), 0, 0, 360,
+                    (60, 60, 80), -1)
+        cv2.ellipse(img, (ex, ey), (int(s * 0.08), int(s * 0.045)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(img, (ex, ey), int(s * 0.035), (40, 30, 30), -1)
+    cv2.line(img, (cx, cy - int(s * 0.05)), (cx - int(s * 0.04), cy + int(s * 0.12)),
+             (110, 130, 170), max(1, s // 40))
+    cv2.ellipse(img, (cx, cy + int(s * 0.26)), (int(s * 0.14), int(s * 0.05)), 0, 0, 360,
+                (80, 80, 160), -1)
+
+
+def make_clip(path, frames=CLIP_FRAMES, size=CLIP_SIZE, faces=False, seed=SEED):
+    """Write a deterministic test clip: a textured scene with moving shapes or faces"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+    background = cv2.resize(noise, size, interpolation=cv2.INTER_CUBIC)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30.0, size)
+    frame = np.empty_like(background)
+    for i in range(frames):
+        np.copyto(frame, background)
+        t = i / max(1, frames - 1)
+        if faces:
+            # Two faces drifting across the frame at different sizes
+            draw_face(frame, int(width * (0.2 + 0.3 * t)), height // 2, height // 3)
+            draw_face(frame, int(width * (0.85 - 0.2 * t)), height // 3, height // 5)
+        else:
+            x = int((width - 200) * t)
+            cv2.rectangle(frame, (x, height // 4), (x + 200, height // 4 + 150), (255, 255, 255), -1)
+            cv2.circle(frame, (width - x - 100, 2 * height // 3), 80, (0, 0, 255), -1)
+        frame[:] = cv2.GaussianBlur(frame, (5, 5), 0)
+        out.write(frame)
+    out.release()
+
+
+def clip_paths(directory, frames=CLIP_FRAMES, size=CLIP_SIZE):
+    """Return the scene and faces clips in directory, generating any that are missing"""
+    os.makedirs(directory, exist_ok=True)
+    clips = {}
+    for name, faces in (("scene", False), ("faces", True)):
+        path = os.path.join(directory, f"{name}_{size[0]}x{size[1]}_{frames}_{SEED}.mp4")
+        if not os.path.exists(path):
+            make_clip(path, frames, size, faces)
+        clips[name] = path
+    return clips
+
+
+#------------------------------------------------#
+#   Benchmarks, each returns the output frame times, and maybe frame counts
+#------------------------------------------------#
+
+class TimedDisplay(Display):
+    """Headless Display that records when each iteration of the main loop finished"""
+
+    def __init__(self, **kwargs):
+        super().__init__(headless=True, **kwargs)
+        self.times = []
+
+    def wait(self):
+        self.times.append(time.perf_counter())
+        return super().wait()
+
+
+def run_pipeline(input_path, transform, is_color=True, workers=1):
+    times = []
+    pipeline = VideoPipeline(input_path, os.path.join(os.getcwd(), "out.mp4"), transform,
+                             is_color=is_color, workers=workers)
+    pipeline.run(preview=lambda frame: times.append(time.perf_counter()))
+    return times
+
+
+def run_camera_app(module, clip, face_mode=False):
+    """Record a clip through a CameraApp, returning loop times and what was recorded"""
+    app = importlib.import_module(module).CameraApp(TimedDisplay(), VideoFileSource(clip))
+    if face_mode:
+        app.set_face_mode(True)
+    app.start_recording()
+    # run() stops the recording and forgets the writer, keep it for its counts
+    writer = app.output_video
+    app.run()
+    frames, written = app.frame_stats(), writer.stats()
+    return app.display.times, {"captured": frames["captured"], "written": written["written"],
+                               "preroll_written": written["preroll_written"],
+                               "writer_dropped": written["dropped"],
+                               "display_stale": frames["display"]["stale"],
+                               "display_dropped": frames["display"]["dropped"]}
+
+
+BENCHMARKS = {
+    "task2-grayscale": lambda clips: run_pipeline(clips["scene"], grayscale, is_color=False),
+    "task4-blur": lambda clips: run_pipeline(clips["scene"], gaussian_blur,
+                                             workers=max(1, (os.cpu_count() or 1) - 2)),
+    "face-detect": lambda clips: run_pipeline(clips["faces"], detect_faces),
+    "lab6task9-record": lambda clips: run_camera_app("Lab6task9", clips["scene"]),
+    "lab6task10-faces": lambda clips: run_camera_app("lab6task10", clips["faces"], face_mode=True),
+}
+
+
+def measure(name, clips):
+    """Run one benchmark in this process and return its metrics"""
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    times = BENCHMARKS[name](clips)
+    seconds = time.perf_counter() - start
+    counts = {}
+    if isinstance(times, tuple):
+        times, counts = times
+        counts["written_fps"] = counts["written"] / seconds if seconds > 0 else 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (usage.ru_utime - start_usage.ru_utime) + (usage.ru_stime - start_usage.ru_stime)
+    intervals = np.diff([start] + times) * 1000 if times else np.zeros(1)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"frames": len(times), "seconds": seconds,
+            "fps": len(times) / seconds if seconds > 0 else 0.0,
+            "p50_ms": float(np.percentile(intervals, 50)),
+            "p99_ms": float(np.percentile(intervals, 99)),
+            "peak_rss_mb": rss_mb,
+            "cpu_percent": 100 * cpu / seconds if seconds > 0 else 0.0,
+            **counts}
+
+
+def run_suite(names, clip_dir, repeat=1, frames=CLIP_FRAMES):
+    """Run each benchmark repeat times in a fresh process, keep the median of each metric"""
+    clip_paths(clip_dir, frames)
+    results = {}
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            # CameraApp and the pipelines write their output to the working directory
+            with tempfile.TemporaryDirectory(prefix="bench_") as work_dir:
+                result_path = os.path.join(work_dir, "result.json")
+                subprocess.run([sys.executable, os.path.abspath(__file__), "--run", name,
+                                "--clip-dir", os.path.abspath(clip_dir), "--frames", str(frames),
+                                "--result", result_path],
+                               cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+                with open(result_path) as f:
+                    runs.append(json.load(f))
+        results[name] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        results[name]["runs"] = repeat
+        print(format_result(name, results[name]))
+    return {"meta": environment(frames), "results": results}
+
+
+def environment(frames):
+    return {"python": platform.python_version(), "opencv": cv2.__version__,
+            "numpy": np.__version__, "machine": platform.machine(),
+            "system": platform.system(), "cpus": os.cpu_count(),
+            "clip": {"size": CLIP_SIZE, "frames": frames, "seed": SEED},
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def format_result(name, r):
+    line = (f"{name:>18}: {r['fps']:7.1f} fps, p50 {r['p50_ms']:6.1f} ms, "
+            f"p99 {r['p99_ms']:6.1f} ms, {r['peak_rss_mb']:6.0f} MB, {r['cpu_percent']:4.0f}% CPU")
+    if "written" in r:
+        line += (f"\n{'':>18}  recorded {r['written']:.0f}/{r['captured']:.0f} captured frames "
+                 f"({r['written_fps']:.1f} fps, +{r['preroll_written']:.0f} pre-roll), "
+                 f"{r['writer_dropped']:.0f} dropped by the writer, display loop "
+                 f"{r['display_stale']:.0f} stale / {r['display_dropped']:.0f} skipped reads")
+    return line
+
+
+def compare(old, new, threshold=0.1):
+    """Return (name, metric, old, new, change) for every regression beyond threshold"""
+    regressions = []
+    for name, after in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in CHECKS.items():
+            if metric not in before or metric not in after:
+                continue
+            old_value, new_value = before[metric], after[metric]
+            if old_value == 0:
+                # No relative change from zero, so any move the wrong way counts
+                worse = new_value < 0 if higher_is_better else new_value > 0
+                if worse:
+                    regressions.append((name, metric, old_value, new_value,
+                                        float("inf") if new_value > 0 else float("-inf")))
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, before[metric], after[metric], change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Lab 6 video pipelines")
+    parser.add_argument("--out", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--only", default=None,
+                        help=f"comma separated benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs per benchmark, the median of each metric is kept")
+    parser.add_argument("--clip-dir", default="bench_clips",
+                        help="where the generated test clips are cached")
+    parser.add_argument("--frames", type=int, default=CLIP_FRAMES,
+                        help=f"frames per test clip (default: {CLIP_FRAMES})")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None,
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change that counts as a regression (default: 0.1)")
+    # Used by run_suite to run a single benchmark in a child process
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        with open(args.result, "w") as f:
+            json.dump(measure(args.run, clip_paths(args.clip_dir, args.frames)), f)
+        sys.exit()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        for name, r in new["results"].items():
+            print(format_result(name, r))
+        regressions = compare(old, new, args.threshold)
+        for name, metric, before, after, change in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.1f} -> {after:.1f} ({change:+.0%})")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    report = run_suite(names, args.clip_dir, args.repeat, args.frames)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
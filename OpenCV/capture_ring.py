@@ -0,0 +1,202 @@
+#Background capture thread and latest-frame ring buffer for CameraApp.
+#CaptureThread reads a frame source (see frame_source.py) in a loop and rotates each
+#frame straight into the next slot of a ring of preallocated frames. Display and detection each get
+#their own RingReader and read at their own rate: a slow consumer skips to
+#the newest frame instead of holding up capture or the other consumers. Each reader
+#counts the frames it dropped (captured but never seen) and its stale reads (asked
+#for a frame when nothing new had arrived).
+#With grey=True each frame is also converted once into a second, single-channel ring,
+#so motion and face detection share one grey frame instead of converting their own.
+#Sinks added with add_sink() are called on the capture thread with every frame, for
+#consumers such as AsyncVideoWriter that queue their own copy and must see them all.
+#With an AllocationCounter set as alloc_counter, each frame's decode, rotate, grey
+#conversion and sinks are counted as its "capture" region.
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from tracing import tracer
+
+
+class FrameRing:
+    def __init__(self, slots, shape, dtype=np.uint8):
+        self.slots = slots
+        self.frames = np.empty((slots,) + tuple(shape), dtype=dtype)
+        # Sequence number held by each slot, -1 while the slot is being written
+        self.slot_seqs = [-1] * slots
+        self.seq = -1  # sequence number of the newest complete frame
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def write_slot(self):
+        """Return the (oldest) slot the next frame should be written into"""
+        i = (self.seq + 1) % self.slots
+        self.slot_seqs[i] = -1
+        return self.frames[i]
+
+    def commit(self):
+        """Publish the frame written into write_slot()"""
+        with self.cond:
+            self.seq += 1
+            self.slot_seqs[self.seq % self.slots] = self.seq
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def copy_latest(self, dst):
+        """Copy the newest frame into dst and return its sequence number (-1 if none yet)"""
+        while True:
+            seq = self.seq
+            if seq < 0:
+                return -1
+            i = seq % self.slots
+            np.copyto(dst, self.frames[i])
+            # If the writer reused the slot during the copy, the frame may be torn
+            if self.slot_seqs[i] == seq:
+                return seq
+
+    def snapshot(self):
+        """Return a copy of the newest frame, or None before the first frame"""
+        frame = np.empty_like(self.frames[0])
+        return frame if self.copy_latest(frame) >= 0 else None
+
+    def reader(self, name):
+        return RingReader(self, name)
+
+
+class RingReader:
+    def __init__(self, ring, name):
+        self.ring = ring
+        self.name = name
+        # Private buffer, so the caller may draw on the frame it gets back
+        self.buffer = np.empty_like(ring.frames[0])
+        self.last_seq = -1
+        self.frames = 0
+        self.dropped = 0
+        self.stale = 0
+
+    def skip_to_latest(self):
+        """Forget older frames, e.g. when a recording starts"""
+        self.last_seq = self.ring.seq
+
+    def read(self, timeout=None):
+        """Wait up to timeout for a frame newer than the last one and return it.
+
+        Returns None, and counts a stale read, if nothing new arrived. Once the ring
+        is closed and fully read it returns None straight away, check closed() to stop.
+        The returned array is this reader's buffer and is overwritten by the next read.
+        """
+        ring = self.ring
+        with ring.cond:
+            if ring.seq <= self.last_seq and timeout != 0:
+                ring.cond.wait_for(lambda: ring.seq > self.last_seq or ring.closed, timeout)
+        if ring.seq <= self.last_seq:
+            if not ring.closed:
+                self.stale += 1
+            return None
+
+        seq = ring.copy_latest(self.buffer)
+        if self.last_seq >= 0:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.frames += 1
+        return self.buffer
+
+    def closed(self):
+        """True once the capture has stopped and every frame has been read"""
+        return self.ring.closed and self.ring.seq <= self.last_seq
+
+    def stats(self):
+        return {"frames": self.frames, "dropped": self.dropped, "stale": self.stale}
+
+
+class CaptureThread(threading.Thread):
+    def __init__(self, source, slots=8, rotate=cv2.ROTATE_180, grey=False):
+        super().__init__(name="capture", daemon=True)
+        self.source = source
+        self.rotate = rotate
+
+        # The first frame fixes the shape of the preallocated ring
+        ret, first = source.read()
+        if not ret:
+            raise IOError("The frame source gave no frames")
+        if rotate in (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE):
+            shape = (first.shape[1], first.shape[0]) + first.shape[2:]
+        else:
+            shape = first.shape
+        self.ring = FrameRing(slots, shape, first.dtype)
+        self.grey_ring = FrameRing(slots, shape[:2], np.uint8) if grey else None
+        self.captured = 0
+        self.started_at = None
+        self.sinks = []
+        self.alloc_counter = None
+        self._sink_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._first = first  # goes into the ring first, so file sources lose no frame
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                counter = self.alloc_counter
+                if counter is not None:
+                    counter.begin_frame("capture")
+                frame, self._first = self._first, None
+                if frame is None:
+                    with tracer.stage("capture.decode"):
+                        ret, frame = self.source.read()
+                    if not ret:
+                        if counter is not None:
+                            counter.end_frame("capture", keep=False)
+                        break  # a file or recording ran out
+                slot = self.ring.write_slot()
+                with tracer.stage("capture.rotate"):
+                    if self.rotate is None:
+                        np.copyto(slot, frame)
+                    else:
+                        cv2.rotate(frame, self.rotate, dst=slot)
+                self.ring.commit()
+                if self.grey_ring is not None:
+                    grey = self.grey_ring.write_slot()
+                    with tracer.stage("capture.cvtColor"):
+                        if slot.ndim == 2:
+                            np.copyto(grey, slot)
+                        else:
+                            cv2.cvtColor(slot, cv2.COLOR_BGR2GRAY, dst=grey)
+                    self.grey_ring.commit()
+                self.captured += 1
+                with self._sink_lock, tracer.stage("capture.sinks"):
+                    for sink in self.sinks:
+                        sink(slot)
+                if counter is not None:
+                    counter.end_frame("capture")
+        finally:
+            self.ring.close()
+            if self.grey_ring is not None:
+                self.grey_ring.close()
+
+    def fps(self, default=30.0):
+        """Measured capture rate so far, or default until a few frames have arrived"""
+        if self.started_at is None or self.captured < 10:
+            return default
+        return self.captured / (time.perf_counter() - self.started_at)
+
+    def add_sink(self, sink):
+        with self._sink_lock:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        """Remove a sink. Once this returns the sink is never called again."""
+        with self._sink_lock:
+            self.sinks.remove(sink)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
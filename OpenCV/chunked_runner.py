@@ -0,0 +1,183 @@
+#Process one long video in parallel frame ranges and write a single output.
+#The video is cut into short ranges (range_frames each) that a pool of worker processes
+#takes in turn. Each worker seeks to the start of its range with CAP_PROP_POS_FRAMES,
+#applies the operation and leaves the frames in a slab of shared memory. The main
+#process writes the slabs to the one cv2.VideoWriter in frame order as they complete
+#and hands each written slab to the next range, so frames are encoded exactly once and
+#memory stays at 2 slabs per worker however long the video is. The ranges come from the
+#source's CAP_PROP_FRAME_COUNT, but the last one reads on to the end of the file (one
+#slab at a time), so frames are never lost if the container undercounts. Any other
+#range that comes up short is an error rather than a shorter video.
+#
+#   python chunked_runner.py task1.mp4 task4.mp4 --op blur --chunks 4
+#   python chunked_runner.py task1.mp4 task4.mp4 --op blur --benchmark
+#The second form compares the chunked run with the serial VideoPipeline.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from batch_runner import OPERATIONS
+from video_pipeline import VideoPipeline, open_video
+
+# Frames per range: long enough that seeking to a keyframe is a small overhead
+RANGE_FRAMES = 32
+
+# Per worker process: the attached shared memory and the open video
+_worker = {}
+
+
+def split_ranges(total_frames, range_frames=RANGE_FRAMES):
+    """Split [0, total_frames) into contiguous (start, end) ranges of range_frames.
+
+    The last range has end=None and runs to the end of the file, so frames are
+    never lost if CAP_PROP_FRAME_COUNT undercounts (or is 0).
+    """
+    ranges = [(start, min(start + range_frames, total_frames))
+              for start in range(0, total_frames, range_frames)]
+    if not ranges:
+        return [(0, None)]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def _attach(shm_name, shape, input_path, op):
+    """Pool initializer: attach to the slabs and open the video once per worker"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(shm=shm, slabs=np.ndarray(shape, np.uint8, buffer=shm.buf),
+                   cap=open_video(input_path), position=None, op=op)
+
+
+def process_range(slab, start, end):
+    """Apply the operation to frames [start, end) into one slab. Executed in a worker process.
+
+    With end=None it reads until the slab is full or the video ends.
+    """
+    transform = OPERATIONS[_worker["op"]][0]
+    cap, frames = _worker["cap"], _worker["slabs"][slab]
+    # Consecutive ranges on the same worker don't need a seek
+    if _worker["position"] != start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    stop = start + len(frames) if end is None else end
+    count = 0
+    while start + count < stop:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames[count] = transform(frame)
+        count += 1
+    _worker["position"] = start + count
+    if end is not None and count != end - start:
+        raise IOError(f"Frames {start}-{end}: the video ended after {count}")
+    return count
+
+
+def run_chunked(input_path, output_path, op, chunks=None, range_frames=RANGE_FRAMES):
+    """Process one video in parallel frame ranges and return frame counts and timing"""
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{op}', choose from {', '.join(OPERATIONS)}")
+    chunks = chunks or os.cpu_count() or 1
+    is_color = OPERATIONS[op][1]
+
+    cap = open_video(input_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {input_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if width <= 0 or height <= 0:
+        raise IOError(f"Could not read the frame size of {input_path}")
+
+    ranges = split_ranges(total_frames, range_frames)
+    # Two slabs per worker, so each one can fill its next slab while the last is written
+    slab_count = max(1, min(2 * chunks, len(ranges)))
+    frame_shape = (height, width, 3) if is_color else (height, width)
+    shape = (slab_count, range_frames) + frame_shape
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    slabs = np.ndarray(shape, np.uint8, buffer=shm.buf)
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height),
+                          isColor=is_color)
+
+    start = time.perf_counter()
+    frames = 0
+    write_time = 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=chunks, initializer=_attach,
+                                 initargs=(shm.name, shape, input_path, op)) as pool:
+            futures = {}
+            r = 0
+            while r < len(ranges):
+                # Range n fills slab n % slab_count, free once range n - slab_count is written
+                while len(futures) + r < min(len(ranges), r + slab_count):
+                    n = r + len(futures)
+                    futures[n] = pool.submit(process_range, n % slab_count, *ranges[n])
+                # Raises the worker's error, e.g. a range that ended early
+                count = futures.pop(r).result()
+                write_start = time.perf_counter()
+                for frame in slabs[r % slab_count, :count]:
+                    out.write(frame)
+                write_time += time.perf_counter() - write_start
+                frames += count
+                # The last range filled its slab, so there may be more frames after it
+                if ranges[r][1] is None and count == range_frames:
+                    ranges.append((ranges[r][0] + count, None))
+                r += 1
+    finally:
+        out.release()
+        del slabs
+        shm.close()
+        shm.unlink()
+
+    seconds = time.perf_counter() - start
+    if frames == 0:
+        raise IOError(f"No frames could be read from {input_path}")
+    # More is fine (the count was low), fewer means frames went missing
+    if frames < total_frames:
+        raise RuntimeError(f"Wrote {frames} frames but the source has {total_frames}")
+    return {"frames": frames, "source_frames": total_frames, "fps": fps,
+            "chunks": chunks, "ranges": len(ranges), "write_seconds": write_time,
+            "seconds": seconds}
+
+
+def benchmark(input_path, output_path, op, chunk_counts=(1, 2, 4)):
+    """Time the serial VideoPipeline and run_chunked on the same video"""
+    transform, is_color = OPERATIONS[op]
+    pipeline = VideoPipeline(input_path, output_path, transform, is_color=is_color)
+    stats = pipeline.run()
+    print(f"  serial pipeline: {stats['total']['frames']} frames in "
+          f"{stats['total']['seconds']:.2f} s ({stats['total']['fps']:.1f} fps)")
+    for chunks in chunk_counts:
+        result = run_chunked(input_path, output_path, op, chunks)
+        print(f"{chunks:>3} worker(s), chunked: {result['frames']} frames in "
+              f"{result['seconds']:.2f} s ({result['frames'] / result['seconds']:.1f} fps), "
+              f"{result['write_seconds']:.2f} s of it encoding")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process one video in parallel frame ranges")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--op", choices=sorted(OPERATIONS), default="blur")
+    parser.add_argument("--chunks", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--range-frames", type=int, default=RANGE_FRAMES,
+                        help=f"frames per range handed to a worker (default: {RANGE_FRAMES})")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare with the serial pipeline for 1, 2 and 4 workers")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.input, args.output, args.op)
+        raise SystemExit
+
+    result = run_chunked(args.input, args.output, args.op, args.chunks, args.range_frames)
+    print(f"Wrote {result['frames']} frames with {result['chunks']} workers in "
+          f"{result['ranges']} ranges: {result['seconds']:.2f} s, "
+          f"{result['write_seconds']:.2f} s of it encoding "
+          f"({result['frames'] / result['seconds']:.1f} fps)")
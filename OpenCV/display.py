@@ -0,0 +1,88 @@
+#Preview windows and key handling for the Lab 6 scripts, with a headless mode.
+#In headless mode nothing is shown and cv2.waitKey is never called, so a loop runs as
+#fast as frames can be decoded and processed and no display is needed. Ctrl+C or
+#--max-frames stop a headless run cleanly, as if 'q' had been pressed.
+
+import argparse
+import signal
+import time
+
+import cv2
+
+# Value cv2.waitKey(...) & 0xFF gives when no key was pressed
+NO_KEY = 0xFF
+
+
+class Display:
+    def __init__(self, headless=False, delay=25, max_frames=None):
+        self.headless = headless
+        self.delay = delay
+        self.max_frames = max_frames
+        self.frames = 0
+        self.start_time = time.perf_counter()
+        self._interrupted = False
+
+        # Without a window there is no 'q' key, so Ctrl+C takes its place
+        if headless:
+            try:
+                signal.signal(signal.SIGINT, self._on_interrupt)
+            except ValueError:
+                pass  # Not on the main thread, leave the default handler
+
+    @classmethod
+    def from_args(cls, args, delay=25):
+        """Create a Display from the options added by add_arguments"""
+        return cls(headless=args.headless, delay=delay, max_frames=args.max_frames)
+
+    def _on_interrupt(self, signum, frame):
+        self._interrupted = True
+
+    def named_window(self, name):
+        if not self.headless:
+            cv2.namedWindow(name)
+
+    def show(self, name, frame):
+        if not self.headless:
+            cv2.imshow(name, frame)
+
+    def destroy_window(self, name):
+        if not self.headless:
+            cv2.destroyWindow(name)
+
+    def wait(self):
+        """Count one frame and return the pressed key, like cv2.waitKey(delay) & 0xFF"""
+        self.frames += 1
+        done = self.max_frames is not None and self.frames >= self.max_frames
+        if self.headless:
+            return ord('q') if done or self._interrupted else NO_KEY
+        key = cv2.waitKey(self.delay) & 0xFF
+        return ord('q') if done else key
+
+    def fps(self):
+        elapsed = time.perf_counter() - self.start_time
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def print_summary(self):
+        elapsed = time.perf_counter() - self.start_time
+        print(f"Processed {self.frames} frames in {elapsed:.2f} s ({self.fps():.1f} fps)")
+
+    def close(self, summary=True):
+        """Close all windows and print the throughput summary"""
+        if not self.headless:
+            cv2.destroyAllWindows()
+        if summary:
+            self.print_summary()
+
+
+def add_arguments(parser):
+    """Add the --headless and --max-frames options to an argparse parser"""
+    parser.add_argument('--headless', action='store_true',
+                        help="skip the preview window and waitKey delay, run as fast as possible")
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help="stop after this many frames")
+    return parser
+
+
+def parse_args(description=None):
+    """Parse the standard display options for a script"""
+    return add_arguments(argparse.ArgumentParser(description=description)).parse_args()
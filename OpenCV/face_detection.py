@@ -0,0 +1,306 @@
+#Face detection helpers shared by the Lab 6 face tasks.
+#detectMultiScale over a full frame is the most expensive call in these scripts, so
+#DetectionScheduler only runs the full Haar cascade every few frames. In between it
+#follows each face by template matching the previous face patch inside a small search
+#window around the last box, which costs a fraction of a cascade pass. When the match
+#score drops below a threshold the full cascade runs again straight away.
+#
+#detect_faces_scaled runs the cascade on a downsampled copy of the frame and maps the
+#boxes back to full resolution. The faces we look for are at least 60 px, far above
+#the cascade's 24 px window, so the full-size search mostly scans scales that can
+#never match.
+#
+#   python face_detection.py task1.mp4 --interval 5
+#compares the scheduler against running the cascade on every frame, and
+#   python face_detection.py task1.mp4 --scales 1,1.5,2,3
+#compares the latency and recall of each downscale factor, and
+#   python face_detection.py task1.mp4 --input-formats
+#compares detecting on a 3-channel BGR2RGB conversion (what CameraApp used to do) with
+#a single-channel grey frame, converted per call or shared with other stages.
+
+import argparse
+import time
+
+import cv2
+
+FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+# The detectMultiScale settings used in Task 7
+TASK7_PARAMS = {"scaleFactor": 1.05, "minNeighbors": 5, "minSize": (60, 60)}
+
+
+def load_face_cascade():
+    return cv2.CascadeClassifier(FACE_CASCADE_PATH)
+
+
+def detect_faces_scaled(cascade, grey, scale=1.0, refine=False, **params):
+    """Detect faces on a copy of grey shrunk by scale and return full-resolution boxes.
+
+    minSize/maxSize in params are given in full-resolution pixels. With refine=True
+    each box is re-detected at full resolution in a small region around it, which
+    tightens the box at the cost of one small cascade pass per face.
+    """
+    params = params or dict(TASK7_PARAMS)
+    if scale <= 1.0:
+        return [tuple(int(v) for v in box) for box in cascade.detectMultiScale(grey, **params)]
+
+    small = cv2.resize(grey, None, fx=1.0 / scale, fy=1.0 / scale, interpolation=cv2.INTER_AREA)
+    small_params = dict(params)
+    for key in ("minSize", "maxSize"):
+        if key in params:
+            w, h = params[key]
+            small_params[key] = (max(1, int(w / scale)), max(1, int(h / scale)))
+
+    boxes = [(int(x * scale), int(y * scale), int(w * scale), int(h * scale))
+             for (x, y, w, h) in cascade.detectMultiScale(small, **small_params)]
+    if refine:
+        boxes = [refine_box(cascade, grey, box, scale, params) for box in boxes]
+    return boxes
+
+
+def refine_box(cascade, grey, box, scale, params):
+    """Re-detect one face at full resolution in a region around a rescaled box"""
+    x, y, w, h = box
+    margin = int(scale) + w // 4
+    frame_h, frame_w = grey.shape[:2]
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(frame_w, x + w + margin), min(frame_h, y + h + margin)
+    local = dict(params, minSize=(int(w * 0.8), int(h * 0.8)))
+    local.pop("maxSize", None)
+    faces = cascade.detectMultiScale(grey[y0:y1, x0:x1], **local)
+    if len(faces) == 0:
+        return box
+    candidates = [(x0 + fx, y0 + fy, fw, fh) for (fx, fy, fw, fh) in faces]
+    best = max(candidates, key=lambda b: iou(box, b))
+    return tuple(int(v) for v in best)
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class DetectionScheduler:
+    def __init__(self, cascade, interval=5, min_confidence=0.6, search_margin=0.5,
+                 scale=1.0, **detect_params):
+        self.cascade = cascade
+        self.interval = max(1, interval)
+        self.scale = scale
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.detect_params = detect_params or dict(TASK7_PARAMS)
+
+        # Each track is (box, template) where template is the grey face patch
+        self.tracks = []
+        self.since_detect = None
+        self.confidence = 0.0
+
+        # Counters for reporting how often the full cascade ran
+        self.frames = 0
+        self.full_detections = 0
+
+    def detect(self, grey):
+        """Run the full cascade and restart tracking from its boxes"""
+        faces = detect_faces_scaled(self.cascade, grey, self.scale, **self.detect_params)
+        self.tracks = [((int(x), int(y), int(w), int(h)), grey[y:y + h, x:x + w].copy())
+                       for (x, y, w, h) in faces]
+        self.since_detect = 0
+        self.confidence = 1.0
+        self.full_detections += 1
+        return [box for box, _ in self.tracks]
+
+    def track(self, grey):
+        """Follow every tracked face with template matching near its last box.
+
+        Returns None if any face could not be found with enough confidence.
+        """
+        frame_h, frame_w = grey.shape[:2]
+        tracks = []
+        confidence = 1.0
+        for (x, y, w, h), template in self.tracks:
+            # The template is smaller than the box when the box ran off the frame edge
+            th, tw = template.shape[:2]
+            mx, my = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(frame_w, x + tw + mx), min(frame_h, y + th + my)
+            roi = grey[y0:y1, x0:x1]
+            if roi.shape[0] < th or roi.shape[1] < tw:
+                return None
+
+            result = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, loc = cv2.minMaxLoc(result)
+            if score < self.min_confidence:
+                return None
+            confidence = min(confidence, score)
+            tracks.append(((x0 + loc[0], y0 + loc[1], w, h), template))
+
+        self.tracks = tracks
+        self.confidence = confidence
+        return [box for box, _ in tracks]
+
+    def update(self, grey):
+        """Return the face boxes for the next grey frame"""
+        self.frames += 1
+        if self.since_detect is None or self.since_detect + 1 >= self.interval:
+            return self.detect(grey)
+
+        self.since_detect += 1
+        if not self.tracks:
+            return []
+        boxes = self.track(grey)
+        # Tracking lost confidence, fall back to the full cascade on this frame
+        if boxes is None:
+            return self.detect(grey)
+        return boxes
+
+
+def compare(baseline, scheduled, min_iou=0.5):
+    """Recall and mean IoU of scheduled boxes against per-frame baseline boxes"""
+    matched = 0
+    total = 0
+    iou_sum = 0.0
+    for base_boxes, boxes in zip(baseline, scheduled):
+        remaining = list(boxes)
+        for base in base_boxes:
+            total += 1
+            if not remaining:
+                continue
+            best = max(remaining, key=lambda b: iou(base, b))
+            overlap = iou(base, best)
+            if overlap >= min_iou:
+                matched += 1
+                iou_sum += overlap
+                remaining.remove(best)
+    recall = matched / total if total else 1.0
+    mean_iou = iou_sum / matched if matched else 0.0
+    return recall, mean_iou
+
+
+def read_frames(video_path, max_frames=None):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def read_grey_frames(video_path, max_frames=None):
+    return [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in read_frames(video_path, max_frames)]
+
+
+def benchmark(video_path, interval=5, max_frames=None):
+    """Time every-frame detection against the scheduler on the same video"""
+    greys = read_grey_frames(video_path, max_frames)
+    cascade = load_face_cascade()
+    start = time.perf_counter()
+    baseline = [cascade.detectMultiScale(g, **TASK7_PARAMS) for g in greys]
+    baseline_time = time.perf_counter() - start
+
+    scheduler = DetectionScheduler(cascade, interval=interval)
+    start = time.perf_counter()
+    scheduled = [scheduler.update(g) for g in greys]
+    scheduled_time = time.perf_counter() - start
+
+    recall, mean_iou = compare(baseline, scheduled)
+    return {"frames": len(greys), "baseline_seconds": baseline_time,
+            "scheduled_seconds": scheduled_time,
+            "speedup": baseline_time / scheduled_time if scheduled_time > 0 else 0.0,
+            "full_detections": scheduler.full_detections,
+            "recall": recall, "mean_iou": mean_iou}
+
+
+def benchmark_scales(video_path, scales, refine=False, max_frames=None):
+    """Per-frame latency and recall against full resolution for each downscale factor"""
+    greys = read_grey_frames(video_path, max_frames)
+    cascade = load_face_cascade()
+    results = []
+    baseline = None
+    for scale in [1.0] + [s for s in scales if s != 1.0]:
+        start = time.perf_counter()
+        boxes = [detect_faces_scaled(cascade, g, scale, refine=refine and scale > 1.0)
+                 for g in greys]
+        seconds = time.perf_counter() - start
+        if baseline is None:
+            baseline = boxes
+        recall, mean_iou = compare(baseline, boxes)
+        results.append({"scale": scale, "ms_per_frame": 1000 * seconds / max(1, len(greys)),
+                        "recall": recall, "mean_iou": mean_iou})
+    return results
+
+
+def benchmark_input(video_path, scale=2.0, max_frames=None, **params):
+    """Per-frame latency of detecting on a 3-channel RGB frame against a grey one.
+
+    "rgb" converts with COLOR_BGR2RGB as CameraApp.detect_face did, "grey" converts
+    to one channel per call, and "shared grey" is given a grey frame that was made
+    once for every stage, so detection pays no conversion at all.
+    """
+    params = params or {"scaleFactor": 1.1, "minNeighbors": 5, "minSize": (150, 150)}
+    frames = read_frames(video_path, max_frames)
+    greys = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+    cascade = load_face_cascade()
+
+    def run(inputs, code):
+        start = time.perf_counter()
+        boxes = [detect_faces_scaled(cascade, f if code is None else cv2.cvtColor(f, code),
+                                     scale, **params) for f in inputs]
+        return boxes, 1000 * (time.perf_counter() - start) / max(1, len(inputs))
+
+    run(greys[:5], None)  # warm up the cascade before timing
+    results = []
+    baseline = None
+    for name, inputs, code in (("shared grey", greys, None),
+                               ("grey", frames, cv2.COLOR_BGR2GRAY),
+                               ("rgb", frames, cv2.COLOR_BGR2RGB)):
+        boxes, ms = run(inputs, code)
+        if baseline is None:
+            baseline = boxes
+        recall, mean_iou = compare(baseline, boxes)
+        results.append({"input": name, "ms_per_frame": ms, "recall": recall,
+                        "mean_iou": mean_iou})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scheduled face detection with every-frame detection")
+    parser.add_argument("video")
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--scales", default=None,
+                        help="comma separated downscale factors to compare instead, e.g. 1,2,3")
+    parser.add_argument("--refine", action="store_true",
+                        help="refine downscaled boxes at full resolution")
+    parser.add_argument("--input-formats", action="store_true",
+                        help="compare 3-channel RGB input with grey, as used by CameraApp")
+    args = parser.parse_args()
+
+    if args.input_formats:
+        for r in benchmark_input(args.video, max_frames=args.max_frames):
+            print(f"{r['input']:>11}: {r['ms_per_frame']:.1f} ms/frame, "
+                  f"recall {r['recall']:.1%}, mean IoU {r['mean_iou']:.2f}")
+        exit()
+
+    if args.scales:
+        scales = [float(s) for s in args.scales.split(",")]
+        for r in benchmark_scales(args.video, scales, args.refine, args.max_frames):
+            print(f"scale {r['scale']:.1f}: {r['ms_per_frame']:.1f} ms/frame, "
+                  f"recall {r['recall']:.1%}, mean IoU {r['mean_iou']:.2f}")
+        exit()
+
+    result = benchmark(args.video, args.interval, args.max_frames)
+    print(f"{result['frames']} frames, full cascade on {result['full_detections']}")
+    print(f"Every frame: {result['baseline_seconds']:.2f} s, "
+          f"scheduled: {result['scheduled_seconds']:.2f} s ({result['speedup']:.1f}x faster)")
+    print(f"Recall vs every-frame boxes: {result['recall']:.1%}, mean IoU {result['mean_iou']:.2f}")
@@ -0,0 +1,226 @@
+#Face detection service shared by several camera streams.
+#Grey frames from any number of sources are copied into slots of one shared-memory
+#block and detected by a pool of worker processes, each of which loads the Haar
+#cascade once. Only the slot number crosses the process boundary, never the pixels.
+#Results come back tagged with the source id and frame index. Each source owns a few
+#slots; when all of them are busy a new frame from that source is dropped instead of
+#queued, so every camera keeps a steady frame rate and simply gets boxes for fewer of
+#its frames.
+#
+#   python face_service.py task1.mp4 --sources 4 --fps 15
+#replays a video as 4 cameras and reports the detection rate of each.
+
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from face_detection import TASK7_PARAMS, detect_faces_scaled, load_face_cascade
+
+Detection = namedtuple("Detection", ["source_id", "frame_index", "boxes", "seconds"])
+
+# Per worker process state, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name, slots, max_shape, scale, params):
+    """Attach to the shared frame slots and load this worker's cascade"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["frames"] = np.ndarray((slots,) + max_shape, dtype=np.uint8, buffer=shm.buf)
+    _worker["cascade"] = load_face_cascade()
+    _worker["scale"] = scale
+    _worker["params"] = params
+
+
+def _detect_slot(slot, height, width):
+    """Detect faces in one shared frame slot. Executed in a worker process."""
+    start = time.perf_counter()
+    grey = _worker["frames"][slot, :height, :width]
+    boxes = detect_faces_scaled(_worker["cascade"], grey, _worker["scale"], **_worker["params"])
+    return boxes, time.perf_counter() - start
+
+
+class FaceDetectionService:
+    def __init__(self, max_shape=(720, 1280), sources=4, slots_per_source=2, workers=None,
+                 scale=2.0, **params):
+        self.max_shape = tuple(max_shape)
+        self.sources = sources
+        self.slots_per_source = slots_per_source
+        self.workers = workers or os.cpu_count() or 1
+        slots = sources * slots_per_source
+
+        frame_bytes = self.max_shape[0] * self.max_shape[1]
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * frame_bytes)
+        self._frames = np.ndarray((slots,) + self.max_shape, dtype=np.uint8,
+                                  buffer=self._shm.buf)
+        # Every source owns its own slots, so a busy camera cannot starve the others
+        self._free = {}
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(self._shm.name, slots, self.max_shape, scale,
+                      params or dict(TASK7_PARAMS)))
+
+        self._results = queue.Queue()
+        self._errors = queue.Queue()
+        self._lock = threading.Lock()
+        self.latest = {}     # source id -> most recent Detection
+        self.submitted = {}  # source id -> frames accepted
+        self.dropped = {}    # source id -> frames dropped because its slots were busy
+
+    def _slots_for(self, source_id):
+        """Return the free-slot queue of a source, giving new sources the next bank of slots"""
+        with self._lock:
+            if source_id not in self._free:
+                bank = len(self._free)
+                if bank >= self.sources:
+                    raise ValueError(f"The service was created for {self.sources} sources")
+                free = queue.Queue()
+                for i in range(self.slots_per_source):
+                    free.put(bank * self.slots_per_source + i)
+                self._free[source_id] = free
+            return self._free[source_id]
+
+    def submit(self, source_id, frame_index, grey, block=False):
+        """Queue one grey frame for detection. Returns False if it was dropped."""
+        height, width = grey.shape[:2]
+        if height > self.max_shape[0] or width > self.max_shape[1]:
+            raise ValueError(f"Frame {grey.shape} is larger than the service's {self.max_shape}")
+        free = self._slots_for(source_id)
+        try:
+            slot = free.get(block=block)
+        except queue.Empty:
+            with self._lock:
+                self.dropped[source_id] = self.dropped.get(source_id, 0) + 1
+            return False
+
+        self._frames[slot, :height, :width] = grey
+        with self._lock:
+            self.submitted[source_id] = self.submitted.get(source_id, 0) + 1
+        future = self._pool.submit(_detect_slot, slot, height, width)
+        future.add_done_callback(
+            lambda f: self._on_done(f, free, slot, source_id, frame_index))
+        return True
+
+    def _on_done(self, future, free, slot, source_id, frame_index):
+        # The slot is released last, so once every slot is free every result is in
+        try:
+            boxes, seconds = future.result()
+        except Exception as e:
+            # Exceptions in a done callback are only logged, keep it for results()
+            self._errors.put((source_id, frame_index, e))
+        else:
+            detection = Detection(source_id, frame_index, boxes, seconds)
+            with self._lock:
+                # Results can finish out of order, keep the newest frame per source
+                current = self.latest.get(source_id)
+                if current is None or current.frame_index < frame_index:
+                    self.latest[source_id] = detection
+            self._results.put(detection)
+        finally:
+            free.put(slot)
+
+    def _raise_error(self):
+        """Re-raise the first worker error not raised yet"""
+        try:
+            source_id, frame_index, error = self._errors.get_nowait()
+        except queue.Empty:
+            return
+        raise RuntimeError(f"Detection failed for source {source_id} "
+                           f"frame {frame_index}: {error!r}") from error
+
+    def results(self):
+        """Return every Detection finished since the last call, raising any worker error"""
+        self._raise_error()
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def boxes(self, source_id):
+        """Most recent boxes for a source, for drawing on its current frame"""
+        detection = self.latest.get(source_id)
+        return detection.boxes if detection is not None else []
+
+    def flush(self):
+        """Wait until every submitted frame has been detected"""
+        for free in list(self._free.values()):
+            while free.qsize() < self.slots_per_source:
+                time.sleep(0.001)
+        self._raise_error()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._frames = None
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def simulate(video_path, sources=4, fps=15.0, seconds=10.0, workers=None):
+    """Replay a video as several cameras at a fixed frame rate and time the service"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    greys = []
+    while len(greys) < 300:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        greys.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+
+    with FaceDetectionService(greys[0].shape, sources=sources, workers=workers) as service:
+        start = time.perf_counter()
+        frame_index = 0
+        while time.perf_counter() - start < seconds:
+            # Each source is offset in the clip so they are not identical
+            for source_id in range(sources):
+                grey = greys[(frame_index + source_id * 37) % len(greys)]
+                service.submit(source_id, frame_index, grey)
+            frame_index += 1
+            # Sleep until the next frame is due
+            delay = start + frame_index / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        elapsed = time.perf_counter() - start
+        service.flush()
+        detections = service.results()
+
+    report = {}
+    for source_id in range(sources):
+        mine = [d for d in detections if d.source_id == source_id]
+        report[source_id] = {"frames": frame_index, "detected": len(mine),
+                             "dropped": service.dropped.get(source_id, 0),
+                             "detect_fps": len(mine) / elapsed}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a video as several cameras through the face service")
+    parser.add_argument("video")
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    report = simulate(args.video, args.sources, args.fps, args.seconds, args.workers)
+    for source_id, r in report.items():
+        print(f"source {source_id}: {r['detected']}/{r['frames']} frames detected "
+              f"({r['detect_fps']:.1f} fps), {r['dropped']} dropped")
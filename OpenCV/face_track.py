@@ -0,0 +1,84 @@
+#Smoothed, fixed-size face crops for CameraApp's face-track video.
+#Face detection runs slower than the camera and its boxes jitter from one detection
+#to the next, so FaceTrack keeps an exponential moving average of x, y, w and h that
+#moves towards the newest box a little on every captured frame. Each crop is a square
+#around the smoothed box, with a margin, resized straight into one preallocated
+#buffer of the size chosen when the recording starts, so every frame of the face
+#video has the same size and no full-frame copy is made.
+#When the face is lost the last box is held, and until the first face is seen each
+#frame is black, so the face video gets exactly one frame per frame of the full
+#recording. PreRollCrops gives the face video the same pre-roll as the full one,
+#cropped at the face box known when recording starts, so frame k of both files shows
+#the same moment.
+
+import cv2
+import numpy as np
+
+
+class FaceTrack:
+    def __init__(self, size=(256, 256), alpha=0.25, margin=0.25):
+        self.size = size  # (width, height) of every crop
+        self.alpha = alpha  # how far the box moves towards a new detection per frame
+        self.margin = margin
+        self.box = None  # smoothed (x, y, w, h) as floats
+        self.buffer = np.empty((size[1], size[0], 3), np.uint8)
+        self.blank = np.zeros_like(self.buffer)  # written until a face has been seen
+
+    def update(self, rect):
+        """Move the smoothed box towards rect, or hold it when rect is None"""
+        if rect is None:
+            return self.box
+        rect = np.asarray(rect, dtype=np.float64)
+        if self.box is None:
+            self.box = rect
+        else:
+            self.box += self.alpha * (rect - self.box)
+        return self.box
+
+    def region(self, frame_shape):
+        """Square crop region around the smoothed box, clamped to the frame"""
+        x, y, w, h = self.box
+        side = max(w, h) * (1 + 2 * self.margin)
+        # Keep the output aspect ratio, so the resize never stretches the face
+        crop_w = side * max(1.0, self.size[0] / self.size[1])
+        crop_h = side * max(1.0, self.size[1] / self.size[0])
+        height, width = frame_shape[:2]
+        crop_w, crop_h = min(crop_w, width), min(crop_h, height)
+        x0 = int(round(min(max(x + w / 2 - crop_w / 2, 0), width - crop_w)))
+        y0 = int(round(min(max(y + h / 2 - crop_h / 2, 0), height - crop_h)))
+        return x0, y0, int(crop_w), int(crop_h)
+
+    def crop(self, frame):
+        """Resize the smoothed face region of frame into the fixed-size buffer.
+
+        Returns the buffer, which the next call overwrites, or None before the first
+        face has been seen.
+        """
+        if self.box is None:
+            return None
+        x, y, w, h = self.region(frame.shape)
+        if w < 1 or h < 1:
+            return None
+        return cv2.resize(frame[y:y+h, x:x+w], self.size, dst=self.buffer,
+                          interpolation=cv2.INTER_AREA)
+
+    def crop_or_blank(self, frame):
+        """crop(), or the black frame while there is nothing to crop"""
+        crop = self.crop(frame)
+        return self.blank if crop is None else crop
+
+
+class PreRollCrops:
+    """Fixed-size crops of pre-roll frames at one face box, sized like the pre-roll"""
+
+    def __init__(self, frames, size, rect=None, margin=0.25):
+        self.frames = frames  # e.g. PreRollFrames, iterated again for the crops
+        self.track = FaceTrack(size=size, margin=margin)
+        self.track.update(rect)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        for frame in self.frames:
+            yield self.track.crop_or_blank(frame)
@@ -0,0 +1,77 @@
+#Stand-in for picamera2.Picamera2 that produces synthetic frames.
+#It supports the calls the Lab 6 camera scripts make (preview_configuration,
+#create_preview_configuration, create_video_configuration, configure, start, stop and
+#capture_array) and paces capture_array to a fixed frame rate like a real sensor, so
+#CameraApp and the Pi tasks can run on machines without a camera.
+#
+#   python Lab6task9.py --source synthetic --headless --max-frames 300
+
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+# Bytes per pixel of the Picamera2 formats used in the labs
+FORMAT_CHANNELS = {"RGB888": 3, "BGR888": 3, "XRGB8888": 4, "XBGR8888": 4}
+
+
+class FakePicamera2:
+    def __init__(self, fps=30.0, seed=0):
+        self.fps = fps
+        self.seed = seed
+        self.preview_configuration = SimpleNamespace(
+            main=SimpleNamespace(size=(640, 480), format="RGB888"))
+        self.size = (640, 480)
+        self.format = "RGB888"
+        self.started = False
+        self.frame_index = 0
+        self._next_time = None
+        self._background = None
+
+    def create_preview_configuration(self, main=None, **kwargs):
+        return {"main": dict(main or {})}
+
+    create_video_configuration = create_preview_configuration
+
+    def configure(self, config):
+        if config == "preview":
+            main = self.preview_configuration.main
+            self.size, self.format = tuple(main.size), main.format
+        else:
+            main = config.get("main", {})
+            self.size = tuple(main.get("size", (640, 480)))
+            self.format = main.get("format", "RGB888")
+
+        # A smooth random background, drawn on fresh for every frame
+        width, height = self.size
+        channels = FORMAT_CHANNELS.get(self.format, 3)
+        rng = np.random.default_rng(self.seed)
+        noise = rng.integers(0, 256, (height // 8, width // 8, channels), dtype=np.uint8)
+        self._background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    def start(self):
+        if self._background is None:
+            self.configure("preview")
+        self.started = True
+        self._next_time = time.perf_counter()
+
+    def stop(self):
+        self.started = False
+
+    def capture_array(self, name="main"):
+        """Return a new synthetic frame, waiting until it is due at the configured fps"""
+        if not self.started:
+            raise RuntimeError("Camera is not started")
+        delay = self._next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time + 1.0 / self.fps, time.perf_counter())
+
+        frame = self._background.copy()
+        width, height = self.size
+        # A square moving across the frame so consecutive frames differ
+        x = (self.frame_index * 8) % max(1, width - 80)
+        cv2.rectangle(frame, (x, height // 3), (x + 80, height // 3 + 80), (255,) * 4, -1)
+        self.frame_index += 1
+        return frame
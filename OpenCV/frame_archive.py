@@ -0,0 +1,416 @@
+#Chunked, losslessly compressed recording format for camera frames (Task 6).
+#Frames are copied into one preallocated chunk buffer as they arrive. When the buffer
+#is full it is compressed and appended to the file, so memory use stays the same no
+#matter how long the recording runs. An index of chunk offsets is written at the end
+#of the file.
+#
+#File layout (all integers little endian):
+#   header  magic "FRMARC1\0", version, height, width, channels, chunk_frames, codec
+#   chunks  compressed frame data, one block per chunk
+#   index   one (offset, size, first_frame, frames, flags) entry per chunk
+#   footer  index offset, chunk count, frame count, magic "FRMEND1\0"
+#A recording with no frames is a header with a 0x0 shape, an empty index and a footer.
+#The index is only written by close(), so use FrameRecorder as a context manager to
+#get a readable file even when the capture loop is interrupted.
+#
+#With delta=True the first frame of every chunk is stored whole as a keyframe and each
+#later frame as its byte-wise difference (mod 256) from the previous one. A static
+#camera produces differences that are almost all zero, which compress far better than
+#the frames themselves, and decoding is bit exact. Keyframes at chunk starts keep
+#random access to one chunk per frame.
+#
+#FrameArchive reads a recording back through a read-only memory map. Asking for frame
+#i decompresses only the chunk that holds it, so multi-GB recordings can be reviewed
+#on a machine with far less RAM. Old task6.npy dumps are opened with np.load's
+#mmap_mode instead. FrameArchive also has the cv2.VideoCapture read()/get()/set()
+#methods, so it can stand in for a capture in the existing grayscale, blur and
+#face-detect code paths.
+#
+#   python frame_archive.py --benchmark
+#compares the archive with np.save and np.savez_compressed on a synthetic
+#static-scene clip.
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# lz4 is much faster than zlib but optional, zlib is always available
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+MAGIC = b"FRMARC1\0"
+END_MAGIC = b"FRMEND1\0"
+VERSION = 2
+
+# Index entry flags
+FLAG_DELTA = 1  # frames after the first are differences from the previous frame
+
+HEADER = struct.Struct("<8sIIIIII")
+INDEX_ENTRY = struct.Struct("<QQQII")
+FOOTER = struct.Struct("<QQQ8s")
+
+CODECS = {"zlib": 0, "lz4": 1}
+
+# Files FrameArchive opens, everything else is a video for cv2.VideoCapture
+ARCHIVE_EXTENSIONS = (".frames", ".npy")
+
+
+def is_archive(path, extensions=ARCHIVE_EXTENSIONS):
+    """True if path is a FrameRecorder archive or an np.save dump, by its extension"""
+    return path.lower().endswith(extensions)
+
+
+def compress(data, codec, level):
+    if codec == "lz4":
+        return lz4.compress(data, compression_level=level)
+    return zlib.compress(data, level)
+
+
+def decompress(data, codec):
+    if codec == "lz4":
+        return lz4.decompress(data)
+    return zlib.decompress(data)
+
+
+def delta_encode(frames, out):
+    """Keep frames[0] and replace every later frame by its difference from the previous"""
+    out[0] = frames[0]
+    np.subtract(frames[1:], frames[:-1], out=out[1:])
+    return out
+
+
+def delta_decode(deltas):
+    """Undo delta_encode, uint8 accumulation wraps mod 256 exactly like the encoder"""
+    return np.cumsum(deltas, axis=0, dtype=np.uint8)
+
+
+class FrameRecorder:
+    def __init__(self, path, chunk_frames=30, codec="zlib", level=6, delta=False):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', choose from {', '.join(CODECS)}")
+        if codec == "lz4" and lz4 is None:
+            raise ImportError("The lz4 codec needs the lz4 package (pip install lz4)")
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.codec = codec
+        self.level = level
+        self.delta = delta
+
+        self.file = open(path, "wb")
+        self.index = []
+        self.frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+        # Created from the first frame's shape
+        self._chunk = None
+        self._count = 0
+
+    def _start(self, frame):
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        self.file.write(HEADER.pack(MAGIC, VERSION, height, width, channels,
+                                    self.chunk_frames, CODECS[self.codec]))
+        self._chunk = np.empty((self.chunk_frames,) + frame.shape, dtype=np.uint8)
+        # Scratch buffer for the differences, reused for every chunk
+        if self.delta:
+            self._deltas = np.empty_like(self._chunk)
+
+    def write(self, frame):
+        """Add one uint8 frame to the recording"""
+        if self._chunk is None:
+            self._start(frame)
+        elif frame.shape != self._chunk.shape[1:]:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self._chunk.shape[1:]}")
+        self._chunk[self._count] = frame
+        self._count += 1
+        self.frames += 1
+        if self._count == self.chunk_frames:
+            self._flush()
+
+    def _flush(self):
+        """Compress the buffered frames and append them as one chunk"""
+        if self._count == 0:
+            return
+        raw = self._chunk[:self._count]
+        flags = FLAG_DELTA if self.delta else 0
+        data = self._encode(raw, flags)
+        offset = self.file.tell()
+        self.file.write(data)
+        self.index.append((offset, len(data), self.frames - self._count, self._count, flags))
+        self.raw_bytes += raw.nbytes
+        self.compressed_bytes += len(data)
+        self._count = 0
+
+    def _encode(self, raw, flags):
+        if flags & FLAG_DELTA:
+            raw = delta_encode(raw, self._deltas[:len(raw)])
+        return compress(raw.data, self.codec, self.level)
+
+    def close(self):
+        """Write the last chunk, the index and the footer"""
+        if self.file.closed:
+            return
+        if self._chunk is None:
+            # Nothing was recorded, there is no frame shape for the header
+            self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0,
+                                        self.chunk_frames, CODECS[self.codec]))
+        self._flush()
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), self.frames, END_MAGIC))
+        self.file.close()
+
+    def ratio(self):
+        """Raw frame bytes divided by compressed bytes"""
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameArchive:
+    def __init__(self, path, fps=30.0, cache_chunks=2):
+        self.path = path
+        self.fps = fps
+        self.cache_chunks = cache_chunks
+        self._cache = OrderedDict()
+        self._position = 0
+        self._file = None
+        self._mm = None
+
+        if is_archive(path, (".npy",)):
+            # Plain numpy dumps are already uncompressed, map them directly
+            self._frames = np.load(path, mmap_mode="r")
+            self.index = None
+            self.shape = self._frames.shape[1:]
+            self.frame_count = len(self._frames)
+            return
+
+        if os.path.getsize(path) < HEADER.size + FOOTER.size:
+            raise ValueError(f"{path} is too short to be a frame archive, "
+                             f"the recording was not closed")
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, height, width, channels, self.chunk_frames, codec = \
+                HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a frame archive")
+            if version > VERSION:
+                raise ValueError(f"{path} uses archive version {version}, newest supported is {VERSION}")
+            index_offset, chunks, self.frame_count, end_magic = \
+                FOOTER.unpack_from(self._mm, len(self._mm) - FOOTER.size)
+            if end_magic != END_MAGIC:
+                raise ValueError(f"{path} has no index, the recording was not closed")
+        except Exception:
+            # Don't leave the file and the map open behind a failed open
+            self.release()
+            raise
+
+        self.codec = {v: k for k, v in CODECS.items()}[codec]
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        if not self.frame_count:
+            # An empty recording, see FrameRecorder.close
+            self.shape = (0, 0)
+        self.index = [INDEX_ENTRY.unpack_from(self._mm, index_offset + i * INDEX_ENTRY.size)
+                      for i in range(chunks)]
+        self._first_frames = [entry[2] for entry in self.index]
+
+    def __len__(self):
+        return self.frame_count
+
+    def _chunk(self, chunk):
+        """Return the decoded frames of one chunk, keeping the last few in a cache"""
+        if chunk in self._cache:
+            self._cache.move_to_end(chunk)
+            return self._cache[chunk]
+        offset, size, _, frames, flags = self.index[chunk]
+        data = decompress(self._mm[offset:offset + size], self.codec)
+        decoded = np.frombuffer(data, dtype=np.uint8).reshape((frames,) + self.shape)
+        if flags & FLAG_DELTA:
+            decoded = delta_decode(decoded)
+            # cumsum's output is writable, and frames are views into the cached chunk
+            decoded.setflags(write=False)
+        self._cache[chunk] = decoded
+        if len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+        return decoded
+
+    def frame(self, i):
+        """Return frame i as a read-only array"""
+        if i < 0:
+            i += self.frame_count
+        if not 0 <= i < self.frame_count:
+            raise IndexError(f"Frame {i} out of range for {self.frame_count} frames")
+        if self.index is None:
+            return self._frames[i]
+        chunk = bisect.bisect_right(self._first_frames, i) - 1
+        return self._chunk(chunk)[i - self._first_frames[chunk]]
+
+    def __getitem__(self, key):
+        """archive[i] returns one frame, archive[a:b:step] an array of frames"""
+        if isinstance(key, slice):
+            indices = range(*key.indices(self.frame_count))
+            if self.index is None:
+                return self._frames[key]
+            frames = np.empty((len(indices),) + self.shape, dtype=np.uint8)
+            for n, i in enumerate(indices):
+                frames[n] = self.frame(i)
+            return frames
+        return self.frame(key)
+
+    def iter_frames(self, start=0, stop=None, step=1):
+        """Yield frames one at a time, decoding each chunk only once"""
+        for i in range(*slice(start, stop, step).indices(self.frame_count)):
+            yield self.frame(i)
+
+    def __iter__(self):
+        return self.iter_frames()
+
+    #------------------------------------------------#
+    #   cv2.VideoCapture compatible interface
+    #------------------------------------------------#
+
+    def isOpened(self):
+        return self.index is None or self._mm is not None
+
+    def read(self):
+        """Return (ret, frame) like cv2.VideoCapture.read, with a writable copy of the frame"""
+        if self._position >= self.frame_count:
+            return False, None
+        frame = self.frame(self._position).copy()
+        self._position += 1
+        return True, frame
+
+    def get(self, prop):
+        values = {cv2.CAP_PROP_FPS: self.fps,
+                  cv2.CAP_PROP_FRAME_WIDTH: self.shape[1],
+                  cv2.CAP_PROP_FRAME_HEIGHT: self.shape[0],
+                  cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+                  cv2.CAP_PROP_POS_FRAMES: self._position}
+        return float(values.get(prop, 0))
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self._position = max(0, min(int(value), self.frame_count))
+        return True
+
+    def release(self):
+        self._cache.clear()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+#------------------------------------------------#
+#   Benchmark
+#------------------------------------------------#
+
+def synthetic_static_clip(frames=120, size=(480, 640), noise=2, seed=0):
+    """A fixed background with light sensor noise and one small moving square"""
+    rng = np.random.default_rng(seed)
+    height, width = size
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8),
+                                  (31, 31), 0)
+    clip = np.empty((frames, height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame = background.copy()
+        if noise:
+            jitter = rng.integers(-noise, noise + 1, frame.shape, dtype=np.int16)
+            frame = np.clip(frame + jitter, 0, 255).astype(np.uint8)
+        x = (i * 5) % (width - 40)
+        cv2.rectangle(frame, (x, height // 2), (x + 40, height // 2 + 40), (0, 0, 255), -1)
+        clip[i] = frame
+    return clip
+
+
+def benchmark(clip, directory):
+    """Size and encode/decode throughput of each storage option, checking exact decoding"""
+    raw_mb = clip.nbytes / 1e6
+    results = []
+
+    def record(name, path, encode, decode):
+        start = time.perf_counter()
+        encode(path)
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = decode(path)
+        decode_time = time.perf_counter() - start
+        results.append({"name": name, "bytes": os.path.getsize(path),
+                        "ratio": clip.nbytes / os.path.getsize(path),
+                        "encode_mb_s": raw_mb / encode_time, "decode_mb_s": raw_mb / decode_time,
+                        "exact": bool(np.array_equal(decoded, clip))})
+
+    def archive(delta, codec="zlib", level=6):
+        def encode(path):
+            with FrameRecorder(path, codec=codec, level=level, delta=delta) as recorder:
+                for frame in clip:
+                    recorder.write(frame)
+
+        def decode(path):
+            with FrameArchive(path) as reader:
+                return reader[:]
+        return encode, decode
+
+    record("np.save", os.path.join(directory, "clip.npy"),
+           lambda p: np.save(p, clip), lambda p: np.load(p))
+    record("np.savez_compressed", os.path.join(directory, "clip.npz"),
+           lambda p: np.savez_compressed(p, frames=clip), lambda p: np.load(p)["frames"])
+    record("archive zlib", os.path.join(directory, "plain.frames"), *archive(False))
+    record("archive zlib + delta", os.path.join(directory, "delta.frames"), *archive(True))
+    if lz4 is not None:
+        record("archive lz4 + delta", os.path.join(directory, "delta_lz4.frames"),
+               *archive(True, codec="lz4", level=0))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame archive tools")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare storage options on a synthetic static-scene clip")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--noise", type=int, default=2, help="sensor noise amplitude in grey levels")
+    parser.add_argument("archive", nargs="?", help="print the details of an archive")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        clip = synthetic_static_clip(args.frames, noise=args.noise)
+        with tempfile.TemporaryDirectory() as directory:
+            for r in benchmark(clip, directory):
+                print(f"{r['name']:>22}: {r['bytes'] / 1e6:8.2f} MB ({r['ratio']:5.1f}:1), "
+                      f"encode {r['encode_mb_s']:7.1f} MB/s, decode {r['decode_mb_s']:7.1f} MB/s, "
+                      f"{'exact' if r['exact'] else 'NOT EXACT'}")
+    elif args.archive:
+        with FrameArchive(args.archive) as reader:
+            print(f"{len(reader)} frames of {reader.shape}")
+            if reader.index is not None:
+                delta = sum(1 for entry in reader.index if entry[4] & FLAG_DELTA)
+                print(f"{len(reader.index)} chunks ({delta} delta coded), codec {reader.codec}")
+    else:
+        parser.print_help()
@@ -0,0 +1,212 @@
+#Frame sources for the Lab 6 scripts, so the Pi camera code paths run anywhere.
+#Every backend has the same contract as cv2.VideoCapture: read() returns (ret, frame)
+#and ret is False once the source is exhausted, get() answers the usual CAP_PROP_*
+#queries, release() closes it, and iterating over a source yields frames until the end.
+#Frames are returned without copying where the backend allows it: a video file is
+#decoded into the same buffer every time and an archive hands out views of its
+#decoded chunks, so a frame is only valid until the next read() and may be read-only.
+#Copy it (or cv2.rotate/cvtColor it into a new array) before keeping or drawing on it.
+#
+#   picamera        the Raspberry Pi camera through picamera2
+#   synthetic       FakePicamera2, paced synthetic frames (no camera needed)
+#   *.frames/*.npy  replay of a FrameRecorder archive or an np.save dump
+#   anything else   a video file, opened with cv2.VideoCapture
+#
+#   python frame_source.py --source task1.mp4 --max-frames 300
+#times how fast a source delivers frames.
+
+import argparse
+import time
+
+import cv2
+
+from fake_camera import FakePicamera2
+from frame_archive import FrameArchive, is_archive
+
+
+class FrameSource:
+    live = False  # True for cameras, which never run out and set their own pace
+
+    def __init__(self, fps=30.0, realtime=False):
+        self.fps = fps
+        self.realtime = realtime  # pace reads to fps, like a camera would
+        self.frames = 0
+        self._next_time = None
+
+    def _pace(self):
+        if not self.realtime:
+            return
+        now = time.perf_counter()
+        if self._next_time is None:
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time = max(self._next_time + 1.0 / self.fps, time.perf_counter())
+
+    def read(self):
+        raise NotImplementedError
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        values = {cv2.CAP_PROP_FPS: self.fps,
+                  cv2.CAP_PROP_FRAME_WIDTH: self.size[0],
+                  cv2.CAP_PROP_FRAME_HEIGHT: self.size[1],
+                  cv2.CAP_PROP_POS_FRAMES: self.frames}
+        return float(values.get(prop, 0))
+
+    def release(self):
+        pass
+
+    def __iter__(self):
+        while True:
+            ret, frame = self.read()
+            if not ret:
+                return
+            yield frame
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class PicameraSource(FrameSource):
+    live = True
+
+    def __init__(self, size=(640, 480), format=None, video=False, camera=None, warmup=0.0):
+        super().__init__(fps=30.0)
+        if camera is None:
+            from picamera2 import Picamera2
+            camera = Picamera2()
+        self.camera = camera
+        self.size = tuple(size)
+
+        main = {"size": self.size}
+        if format is not None:
+            main["format"] = format
+        if video:
+            config = camera.create_video_configuration(main=main)
+        else:
+            config = camera.create_preview_configuration(main=main)
+        camera.configure(config)
+        camera.start()
+        # Give the sensor time to settle its exposure before the first frame
+        if warmup:
+            time.sleep(warmup)
+
+    def read(self):
+        # picamera2 hands over a new array for every frame, there is nothing to reuse
+        frame = self.camera.capture_array()
+        self.frames += 1
+        return True, frame
+
+    def release(self):
+        self.camera.stop()
+
+
+class SyntheticSource(PicameraSource):
+    """FakePicamera2 behind the camera backend, for machines without a camera"""
+
+    def __init__(self, size=(640, 480), format=None, video=False, fps=30.0, seed=0):
+        super().__init__(size, format, video, camera=FakePicamera2(fps=fps, seed=seed))
+        self.fps = fps
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, realtime=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video: {path}")
+        super().__init__(self.cap.get(cv2.CAP_PROP_FPS) or 30.0, realtime)
+        self.size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._buffer = None
+
+    def read(self):
+        self._pace()
+        # Decode into the previous frame's buffer instead of allocating a new one
+        ret, frame = self.cap.read(self._buffer)
+        if not ret:
+            return False, None
+        self._buffer = frame
+        self.frames += 1
+        return True, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+
+class ArchiveSource(FrameSource):
+    def __init__(self, path, fps=30.0, realtime=False):
+        super().__init__(fps, realtime)
+        self.archive = FrameArchive(path, fps=fps)
+        self.size = (self.archive.shape[1], self.archive.shape[0])
+
+    def read(self):
+        if self.frames >= len(self.archive):
+            return False, None
+        self._pace()
+        # A read-only view of the decoded chunk, no copy
+        frame = self.archive.frame(self.frames)
+        self.frames += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.archive))
+        return super().get(prop)
+
+    def release(self):
+        self.archive.release()
+
+
+def open_source(spec, size=(640, 480), format=None, video=False, realtime=False,
+                warmup=0.0):
+    """Open a frame source by name ("picamera", "synthetic") or by file path.
+
+    size, format and video configure the camera backends, realtime paces file and
+    archive replay to their frame rate.
+    """
+    if spec == "picamera":
+        return PicameraSource(size, format, video, warmup=warmup)
+    if spec == "synthetic":
+        return SyntheticSource(size, format, video)
+    if is_archive(spec):
+        return ArchiveSource(spec, realtime=realtime)
+    return VideoFileSource(spec, realtime=realtime)
+
+
+def add_source_arguments(parser, default="picamera"):
+    """Add the --source and --realtime options to an argparse parser"""
+    parser.add_argument('--source', default=default,
+                        help="picamera, synthetic, a video file or a .frames/.npy recording "
+                             f"(default: {default})")
+    parser.add_argument('--realtime', action='store_true',
+                        help="replay files at their frame rate instead of as fast as possible")
+    return parser
+
+
+if __name__ == "__main__":
+    parser = add_source_arguments(argparse.ArgumentParser(description="Time a frame source"),
+                                  default="synthetic")
+    parser.add_argument('--max-frames', type=int, default=300)
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=args.realtime)
+    start = time.perf_counter()
+    for frame in source:
+        if source.frames >= args.max_frames:
+            break
+    seconds = time.perf_counter() - start
+    source.release()
+    print(f"{source.frames} frames of {source.size[0]}x{source.size[1]} in {seconds:.2f} s "
+          f"({source.frames / seconds:.1f} fps)")
@@ -0,0 +1,625 @@
+#Batch image processing with the operations from OtherOpenCVconcepts.py.
+#A chain is a declarative list of steps, each a dict naming the operation and its
+#parameters, for example the resize-and-rotate of section 1:
+#   [{"op": "resize", "size": [300, 300]}, {"op": "rotate", "angle": 90}]
+#run_batch() spreads the images over a thread pool. Each worker decodes an image,
+#runs the chain and writes the result itself, and cv2 releases the GIL for all three,
+#so decoding, processing and writing of different images overlap on separate cores.
+#Every step writes into a buffer that the worker keeps for the next image of the
+#same shape, so a folder of same-sized images allocates its intermediates only once
+#per worker.
+#
+#   python image_ops.py photos/ --chain section1 --output-dir out
+#   python image_ops.py --synthetic 10000 --chain blue --workers 8
+#The second form generates 10k test images once (cached in --synthetic-dir) and
+#reports the throughput in images/sec. Add --trace-summary 5 for per-step timings.
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import tracing
+from tracing import tracer
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+#------------------------------------------------#
+#   Operations
+#------------------------------------------------#
+# Each operation maps an input shape to its output shape and writes its result into
+# dst, a buffer of that shape. in_place operations draw on their input instead.
+# halo is how many pixels around an output pixel its value depends on, which is what
+# tiled.py overlaps tiles by; None means the operation cannot run on tiles.
+
+class Op:
+    in_place = False
+    halo = 0
+
+    def output_shape(self, shape):
+        return shape
+
+    def apply(self, src, dst):
+        raise NotImplementedError
+
+
+class Resize(Op):
+    """cv2.resize to a fixed (width, height) (section 1)"""
+
+    halo = None
+
+    def __init__(self, size=(300, 300), interpolation=cv2.INTER_LINEAR):
+        self.size = tuple(size)
+        self.interpolation = interpolation
+
+    def output_shape(self, shape):
+        return (self.size[1], self.size[0]) + shape[2:]
+
+    def apply(self, src, dst):
+        return cv2.resize(src, self.size, dst=dst, interpolation=self.interpolation)
+
+    def affine(self, shape):
+        """Matrix taking input pixel coordinates to output ones, pixel centres aligned"""
+        sx, sy = self.size[0] / shape[1], self.size[1] / shape[0]
+        return np.array([[sx, 0, (sx - 1) / 2], [0, sy, (sy - 1) / 2], [0, 0, 1]])
+
+
+class Rotate(Op):
+    """cv2.rotate by a multiple of 90 degrees clockwise (section 1)"""
+
+    CODES = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180,
+             270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+    halo = None
+
+    def __init__(self, angle=90):
+        if angle not in self.CODES:
+            raise ValueError(f"rotate angle must be one of {sorted(self.CODES)}, got {angle}")
+        self.angle = angle
+
+    def output_shape(self, shape):
+        if self.angle == 180:
+            return shape
+        return (shape[1], shape[0]) + shape[2:]
+
+    def apply(self, src, dst):
+        return cv2.rotate(src, self.CODES[self.angle], dst=dst)
+
+    def affine(self, shape):
+        """Matrix taking input pixel coordinates to output ones"""
+        height, width = shape[:2]
+        if self.angle == 90:
+            return np.array([[0, -1, height - 1], [1, 0, 0], [0, 0, 1]], np.float64)
+        if self.angle == 180:
+            return np.array([[-1, 0, width - 1], [0, -1, height - 1], [0, 0, 1]], np.float64)
+        return np.array([[0, 1, 0], [-1, 0, width - 1], [0, 0, 1]], np.float64)
+
+
+class GaussianBlur(Op):
+    """cv2.GaussianBlur with a square kernel (section 2)"""
+
+    def __init__(self, ksize=15, sigma=0):
+        self.ksize = ksize
+        self.sigma = sigma
+        self.halo = ksize // 2
+
+    def apply(self, src, dst):
+        return cv2.GaussianBlur(src, (self.ksize, self.ksize), self.sigma, dst=dst)
+
+
+class MedianBlur(Op):
+    """cv2.medianBlur (section 2)"""
+
+    def __init__(self, ksize=15):
+        self.ksize = ksize
+        self.halo = ksize // 2
+
+    def apply(self, src, dst):
+        return cv2.medianBlur(src, self.ksize, dst=dst)
+
+
+class Grayscale(Op):
+    def output_shape(self, shape):
+        return shape[:2]
+
+    def apply(self, src, dst):
+        if src.ndim == 2:
+            np.copyto(dst, src)
+            return dst
+        return cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)
+
+
+class Canny(Op):
+    """cv2.Canny edges, colour input is converted to grey first (section 3)"""
+
+    # The 3x3 Sobel and the non-maximum suppression reach 2 pixels. Hysteresis is not
+    # local at all, tiled.py links edges across tiles in a separate pass.
+    halo = 2
+
+    def __init__(self, low=100, high=200):
+        self.low = low
+        self.high = high
+        self._grey = threading.local()  # per-worker grey buffer for colour input
+
+    def output_shape(self, shape):
+        return shape[:2]
+
+    def apply(self, src, dst):
+        if src.ndim == 3:
+            grey = getattr(self._grey, "buffer", None)
+            if grey is None or grey.shape != src.shape[:2]:
+                grey = self._grey.buffer = np.empty(src.shape[:2], np.uint8)
+            src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=grey)
+        return cv2.Canny(src, self.low, self.high, edges=dst)
+
+
+class HSVMask(Op):
+    """Keep the pixels inside an HSV range, blue by default (section 4).
+
+    With apply=False the output is the single-channel mask itself.
+    """
+
+    def __init__(self, lower=(100, 150, 0), upper=(140, 255, 255), apply=True):
+        self.lower = np.array(lower, np.uint8)
+        self.upper = np.array(upper, np.uint8)
+        self.apply_mask = apply
+        self._scratch = threading.local()  # per-worker hsv and mask buffers
+
+    def output_shape(self, shape):
+        return shape if self.apply_mask else shape[:2]
+
+    def _buffers(self, shape):
+        hsv = getattr(self._scratch, "hsv", None)
+        if hsv is None or hsv.shape != shape:
+            self._scratch.hsv = np.empty(shape, np.uint8)
+            self._scratch.mask = np.empty(shape[:2], np.uint8)
+        return self._scratch.hsv, self._scratch.mask
+
+    def apply(self, src, dst):
+        hsv, mask = self._buffers(src.shape)
+        cv2.cvtColor(src, cv2.COLOR_BGR2HSV, dst=hsv)
+        if not self.apply_mask:
+            return cv2.inRange(hsv, self.lower, self.upper, dst=dst)
+        cv2.inRange(hsv, self.lower, self.upper, dst=mask)
+        dst[:] = 0  # bitwise_and leaves pixels outside the mask untouched
+        return cv2.bitwise_and(src, src, dst=dst, mask=mask)
+
+
+class Draw(Op):
+    """Draw shapes and labels on the image in place (section 5).
+
+    Each shape is a list of the arguments of the matching cv2 call after the image,
+    e.g. {"circles": [[[150, 150], 50, [255, 0, 0], -1]]}.
+    """
+
+    in_place = True
+    halo = None
+
+    def __init__(self, circles=(), rectangles=(), lines=(), texts=()):
+        self.circles = [self._tuples(c) for c in circles]
+        self.rectangles = [self._tuples(r) for r in rectangles]
+        self.lines = [self._tuples(l) for l in lines]
+        self.texts = [self._tuples(t) for t in texts]
+
+    @staticmethod
+    def _tuples(args):
+        # JSON gives lists, cv2 wants tuples for points and colours
+        return [tuple(a) if isinstance(a, list) else a for a in args]
+
+    def apply(self, src, dst):
+        for args in self.circles:
+            cv2.circle(src, *args)
+        for args in self.rectangles:
+            cv2.rectangle(src, *args)
+        for args in self.lines:
+            cv2.line(src, *args)
+        for text, org, scale, colour, *thickness in self.texts:
+            cv2.putText(src, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, colour, *thickness)
+        return src
+
+
+OPS = {
+    "resize": Resize,
+    "rotate": Rotate,
+    "gaussian_blur": GaussianBlur,
+    "median_blur": MedianBlur,
+    "grayscale": Grayscale,
+    "canny": Canny,
+    "hsv_mask": HSVMask,
+    "draw": Draw,
+}
+
+# The routines of OtherOpenCVconcepts.py as ready-made chains
+CHAINS = {
+    "section1": [{"op": "resize", "size": [300, 300]}, {"op": "rotate", "angle": 90}],
+    "gaussian": [{"op": "gaussian_blur", "ksize": 15}],
+    "median": [{"op": "median_blur", "ksize": 15}],
+    "edges": [{"op": "canny", "low": 100, "high": 200}],
+    "blue": [{"op": "hsv_mask", "lower": [100, 150, 0], "upper": [140, 255, 255]}],
+    "shapes": [{"op": "draw",
+                "circles": [[[150, 150], 50, [255, 0, 0], -1]],
+                "rectangles": [[[200, 50], [300, 150], [0, 255, 0], 3]],
+                "lines": [[[100, 200], [300, 200], [0, 0, 255], 5]],
+                "texts": [["Circle", [130, 140], 0.5, [255, 255, 255], 1],
+                          ["Rectangle", [200, 40], 0.5, [255, 255, 255], 1],
+                          ["Line", [100, 220], 0.5, [255, 255, 255], 1]]}],
+}
+
+
+#------------------------------------------------#
+#   Fusion
+#------------------------------------------------#
+# OpChain(steps, fuse=True) rewrites the chain before running it, so that fewer
+# full-size intermediate images are written and read back:
+#   rotations  adjacent rotate steps become one rotation (or none)
+#   hsv_tiles  hsv_mask converts, masks and applies one strip of rows at a time, so
+#              the HSV image and mask never exist at full size and stay in cache
+#   affine     a run of resize and rotate steps becomes one cv2.warpAffine, with no
+#              intermediate image. Results can differ from resize+rotate by a few grey
+#              levels, and warpAffine costs more per pixel than resize+rotate, so this
+#              only pays when memory is the limit. It is not in DEFAULT_FUSIONS.
+# python image_ops.py --fusion-benchmark compares the fused and unfused chains.
+
+class AffineWarp(Op):
+    """A run of resize and rotate steps done as one cv2.warpAffine"""
+
+    halo = None
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.interpolation = next((op.interpolation for op in ops if isinstance(op, Resize)),
+                                  cv2.INTER_LINEAR)
+        self._plans = {}  # input shape -> (inverse matrix, output shape)
+
+    def _plan(self, shape):
+        plan = self._plans.get(shape)
+        if plan is None:
+            matrix, out_shape = np.eye(3), shape
+            for op in self.ops:
+                matrix = op.affine(out_shape) @ matrix
+                out_shape = op.output_shape(out_shape)
+            plan = self._plans[shape] = (np.linalg.inv(matrix)[:2], out_shape)
+        return plan
+
+    def output_shape(self, shape):
+        return self._plan(shape)[1]
+
+    def apply(self, src, dst):
+        matrix, shape = self._plan(src.shape)
+        # Resize clamps at the edges, so replicate the border to match it
+        return cv2.warpAffine(src, matrix, (shape[1], shape[0]), dst=dst,
+                              flags=self.interpolation | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+
+class TiledHSVMask(HSVMask):
+    """HSVMask done one strip of rows at a time, with strip-sized scratch buffers"""
+
+    def __init__(self, lower=(100, 150, 0), upper=(140, 255, 255), apply=True, rows=32):
+        super().__init__(lower, upper, apply)
+        self.rows = rows
+
+    def apply(self, src, dst):
+        hsv, mask = self._buffers((self.rows,) + src.shape[1:])
+        for top in range(0, src.shape[0], self.rows):
+            strip = src[top:top + self.rows]
+            n = strip.shape[0]
+            cv2.cvtColor(strip, cv2.COLOR_BGR2HSV, dst=hsv[:n])
+            if not self.apply_mask:
+                cv2.inRange(hsv[:n], self.lower, self.upper, dst=dst[top:top + n])
+                continue
+            cv2.inRange(hsv[:n], self.lower, self.upper, dst=mask[:n])
+            out = dst[top:top + n]
+            out[:] = 0
+            cv2.bitwise_and(strip, strip, dst=out, mask=mask[:n])
+        return dst
+
+
+FUSIONS = ("rotations", "hsv_tiles", "affine")
+DEFAULT_FUSIONS = ("rotations", "hsv_tiles")
+
+# Resize interpolations that warpAffine can reproduce (not INTER_AREA)
+_AFFINE_INTERPOLATIONS = (cv2.INTER_NEAREST, cv2.INTER_LINEAR, cv2.INTER_CUBIC)
+
+
+def _fusable_geometry(op):
+    if isinstance(op, Rotate):
+        return True
+    return isinstance(op, Resize) and op.interpolation in _AFFINE_INTERPOLATIONS
+
+
+def fuse_ops(ops, fusions=DEFAULT_FUSIONS):
+    """Rewrite a list of (name, op) pairs into an equivalent list with fewer passes"""
+    unknown = set(fusions) - set(FUSIONS)
+    if unknown:
+        raise ValueError(f"Unknown fusion(s) {', '.join(sorted(unknown))}, choose from {', '.join(FUSIONS)}")
+
+    if "rotations" in fusions:
+        folded = []
+        for name, op in ops:
+            if isinstance(op, Rotate) and folded and isinstance(folded[-1][1], Rotate):
+                angle = (folded.pop()[1].angle + op.angle) % 360
+                if angle:
+                    folded.append(("rotate", Rotate(angle)))
+            else:
+                folded.append((name, op))
+        ops = folded
+
+    if "affine" in fusions:
+        fused, run = [], []
+
+        def flush():
+            # A run worth fusing has a resize and more than one step
+            if len(run) > 1 and any(isinstance(op, Resize) for _, op in run):
+                fused.append(("affine", AffineWarp([op for _, op in run])))
+            else:
+                fused.extend(run)
+            run.clear()
+
+        for name, op in ops:
+            if not _fusable_geometry(op):
+                flush()
+                fused.append((name, op))
+                continue
+            # One warp has one interpolation
+            if isinstance(op, Resize) and any(isinstance(o, Resize) and o.interpolation != op.interpolation
+                                              for _, o in run):
+                flush()
+            run.append((name, op))
+        flush()
+        ops = fused
+
+    if "hsv_tiles" in fusions:
+        ops = [("hsv_mask_tiled", TiledHSVMask(op.lower, op.upper, op.apply_mask))
+               if type(op) is HSVMask else (name, op) for name, op in ops]
+    return ops
+
+
+#------------------------------------------------#
+#   Chains
+#------------------------------------------------#
+
+class OpChain:
+    def __init__(self, steps, fuse=False):
+        """steps is a list of {"op": name, **params} dicts, or a CHAINS name.
+
+        fuse=True applies DEFAULT_FUSIONS, or pass a list of FUSIONS names.
+        """
+        if isinstance(steps, str):
+            if steps not in CHAINS:
+                raise ValueError(f"Unknown chain '{steps}', choose from {', '.join(CHAINS)}")
+            steps = CHAINS[steps]
+        self.steps = [dict(step) for step in steps]
+        self.ops = []
+        for step in self.steps:
+            params = dict(step)
+            name = params.pop("op")
+            if name not in OPS:
+                raise ValueError(f"Unknown operation '{name}', choose from {', '.join(OPS)}")
+            self.ops.append((name, OPS[name](**params)))
+        if fuse:
+            self.ops = fuse_ops(self.ops, DEFAULT_FUSIONS if fuse is True else fuse)
+        self._local = threading.local()
+
+    def _buffer(self, index, shape):
+        """This thread's output buffer for step index, reused while the shape repeats"""
+        buffers = self._local.__dict__.setdefault("buffers", {})
+        buffer = buffers.get(index)
+        if buffer is None or buffer.shape != shape:
+            buffer = buffers[index] = np.empty(shape, np.uint8)
+        return buffer
+
+    def apply(self, image):
+        """Run every step on image and return the result.
+
+        The result is a buffer owned by the calling thread, valid until that thread's
+        next apply(). image itself is drawn on by in-place steps.
+        """
+        for index, (name, op) in enumerate(self.ops):
+            with tracer.stage(f"ops.{name}"):
+                if op.in_place:
+                    image = op.apply(image, None)
+                else:
+                    image = op.apply(image, self._buffer(index, op.output_shape(image.shape)))
+        return image
+
+
+#------------------------------------------------#
+#   Batches
+#------------------------------------------------#
+
+def list_images(source):
+    """Return the images in a directory, or a list of paths unchanged"""
+    if not isinstance(source, str):
+        return list(source)
+    names = sorted(os.listdir(source))
+    return [os.path.join(source, name) for name in names
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def process_image(chain, input_path, output_path):
+    """Decode, process and write one image. Runs on a worker thread."""
+    with tracer.stage("ops.decode"):
+        image = cv2.imread(input_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return False
+    result = chain.apply(image)
+    if output_path is None:
+        return True
+    with tracer.stage("ops.write"):
+        return cv2.imwrite(output_path, result)
+
+
+def run_batch(inputs, chain, output_dir=None, workers=None, ext=None):
+    """Run chain over every input image on a thread pool and report the throughput.
+
+    Results go to output_dir under the input's file name (with its extension replaced
+    by ext if given), or are discarded when output_dir is None.
+    """
+    if not isinstance(chain, OpChain):
+        chain = OpChain(chain)
+    inputs = list_images(inputs)
+    workers = workers or os.cpu_count() or 1
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def output_path(input_path):
+        if output_dir is None:
+            return None
+        name = os.path.basename(input_path)
+        if ext is not None:
+            name = os.path.splitext(name)[0] + ext
+        return os.path.join(output_dir, name)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda path: process_image(chain, path, output_path(path)),
+                                inputs))
+    seconds = time.perf_counter() - start
+    failed = [path for path, ok in zip(inputs, results) if not ok]
+    return {"images": len(inputs) - len(failed), "failed": failed, "workers": workers,
+            "seconds": seconds,
+            "images_per_sec": (len(inputs) - len(failed)) / seconds if seconds > 0 else 0.0}
+
+
+def make_test_image(rng, size=(640, 480)):
+    """A smooth random scene with a blue rectangle to segment and a white circle"""
+    width, height = size
+    noise = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = cv2.resize(noise, size, interpolation=cv2.INTER_CUBIC)
+    x, y = int(rng.integers(0, width - 100)), int(rng.integers(0, height - 100))
+    cv2.rectangle(image, (x, y), (x + 100, y + 80), (200, 60, 20), -1)
+    cv2.circle(image, (width - x, height - y), 40, (255, 255, 255), -1)
+    return image
+
+
+def make_test_images(directory, count, size=(640, 480), seed=0):
+    """Write count synthetic JPEG test images, skipping any already there"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        image = make_test_image(rng, size)  # drawn even when cached, so files stay seeded
+        path = os.path.join(directory, f"img_{i:05d}.jpg")
+        if not os.path.exists(path):
+            cv2.imwrite(path, image)
+    return directory
+
+
+def _naive_section1(image, size):
+    return cv2.rotate(cv2.resize(image, size), cv2.ROTATE_90_CLOCKWISE)
+
+
+def _naive_section4(image):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([100, 150, 0]), np.array([140, 255, 255]))
+    return cv2.bitwise_and(image, image, mask=mask)
+
+
+def fusion_benchmark(size=(4000, 3000), repeat=10):
+    """Latency and peak memory of the section 1 and 4 chains: as written, chained, fused.
+
+    Peak memory is the tracemalloc peak of the first call, which allocates every
+    buffer the chain keeps. Latency is the median of repeat calls after that.
+    """
+    import tracemalloc
+
+    image = make_test_image(np.random.default_rng(0), size)
+    half = (size[0] // 2, size[1] // 2)
+    cases = {
+        "section1 300x300": ([{"op": "resize", "size": [300, 300]}, {"op": "rotate", "angle": 90}],
+                             lambda: _naive_section1(image, (300, 300))),
+        f"section1 {half[0]}x{half[1]}": ([{"op": "resize", "size": list(half)},
+                                           {"op": "rotate", "angle": 90}],
+                                          lambda: _naive_section1(image, half)),
+        "section4 blue": (CHAINS["blue"], lambda: _naive_section4(image)),
+    }
+    results = []
+    for case, (steps, naive) in cases.items():
+        variants = {"as written": naive}
+        previous = None
+        for label, fuse in (("chain", False), ("fused", True), ("fused+affine", FUSIONS)):
+            chain = OpChain(steps, fuse=fuse)
+            names = [name for name, _ in chain.ops]
+            if names == previous:
+                continue  # no fusion rule applied, same as the variant before
+            previous = names
+            variants[label] = chain.apply
+
+        for label, run in variants.items():
+            args = () if label == "as written" else (image,)
+            tracemalloc.start()
+            run(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(*args)
+                times.append(time.perf_counter() - start)
+            results.append((case, label, 1000 * float(np.median(times)), peak / 1e6))
+    return results
+
+
+def load_chain(spec):
+    """A CHAINS name, a JSON list of steps, or the path of a JSON file holding one"""
+    if spec in CHAINS:
+        return spec
+    if os.path.exists(spec):
+        with open(spec) as f:
+            return json.load(f)
+    return json.loads(spec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an OtherOpenCVconcepts operation chain over many images")
+    parser.add_argument("source", nargs="?", default=None, help="directory of images")
+    parser.add_argument("--chain", default="section1",
+                        help=f"one of {', '.join(CHAINS)}, a JSON list of steps or a JSON file")
+    parser.add_argument("--output-dir", default=None,
+                        help="where to write the results (default: process without writing)")
+    parser.add_argument("--ext", default=None, help="output extension, e.g. .png")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker threads (default: CPU count)")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N",
+                        help="benchmark on N generated 640x480 images instead of source")
+    parser.add_argument("--synthetic-dir", default=os.path.join(tempfile.gettempdir(), "image_ops_test"),
+                        help="where the generated images are cached")
+    parser.add_argument("--fuse", action="store_true",
+                        help=f"fuse steps before running ({', '.join(DEFAULT_FUSIONS)})")
+    parser.add_argument("--fusion-benchmark", action="store_true",
+                        help="compare fused and unfused section 1 and 4 chains and exit")
+    parser.add_argument("--size", default="4000x3000",
+                        help="image size for --fusion-benchmark (default: 4000x3000)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args(args)
+
+    if args.fusion_benchmark:
+        size = tuple(int(v) for v in args.size.split("x"))
+        for case, label, ms, mb in fusion_benchmark(size):
+            print(f"{case:>20} {label:>12}: {ms:8.2f} ms, peak {mb:7.1f} MB")
+        raise SystemExit
+
+    if args.synthetic:
+        source = list_images(make_test_images(args.synthetic_dir, args.synthetic))[:args.synthetic]
+    elif args.source:
+        source = args.source
+    else:
+        parser.error("give a source directory or --synthetic N")
+
+    chain = OpChain(load_chain(args.chain), fuse=args.fuse)
+    report = run_batch(source, chain, args.output_dir, args.workers, args.ext)
+    print(f"{report['images']} images in {report['seconds']:.2f} s with {report['workers']} "
+          f"workers: {report['images_per_sec']:.1f} images/sec")
+    if report["failed"]:
+        print(f"{len(report['failed'])} images could not be read: {report['failed'][:5]}")
+    if tracer.enabled:
+        print(tracer.format_summary())
+    if args.trace:
+        print(f"Wrote {tracer.export_trace(args.trace)} trace events to {args.trace}")
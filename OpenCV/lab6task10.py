@@ -2,30 +2,75 @@
 #Update your camera application to include face cropping functionality for both image
 #capture and video recording.
 
+import argparse
 import cv2
-from picamera2 import Picamera2
 import numpy as np
+import threading
 import time
 import os
 from datetime import datetime
 
+from alloc_counter import AllocationCounter
+from async_writer import AsyncVideoWriter
+from capture_ring import CaptureThread
+from display import Display, add_arguments
+from face_detection import detect_faces_scaled, load_face_cascade
+from face_track import FaceTrack, PreRollCrops
+from frame_source import add_source_arguments, open_source
+from motion import MotionDetector, MotionTrigger
+from overlay import StaticOverlay
+from preroll import PreRollBuffer
+import tracing
+from tracing import tracer
+
 class CameraApp:
-    def __init__(self):
-        # Initialize camera
-        self.picam2 = Picamera2()
-        self.picam2.preview_configuration.main.size = (1280, 720)
-        self.picam2.preview_configuration.main.format = "RGB888"
-        self.picam2.configure("preview")
-        self.picam2.start()
+    def __init__(self, display=None, source=None, preroll_seconds=3.0):
+        # Preview window and key handling (headless when run with --headless)
+        self.display = display if display is not None else Display(delay=1)
+
+        # Initialize camera (or any other frame source, see frame_source.py)
+        if source is None:
+            source = open_source("picamera", size=(1280, 720), format="RGB888")
+        self.source = source
+        # The camera is mounted upside down, recorded files are already the right way up
+        rotate = cv2.ROTATE_180 if source.live else None
+
+        # Capture runs on its own thread into a ring of preallocated frames that the
+        # display reads at its own rate, plus a grey copy of each frame that face and
+        # motion detection share, and feeds the recording writer's queue
+        self.capture = CaptureThread(source, slots=8, rotate=rotate, grey=True)
+        height, width = self.capture.ring.frames.shape[1:3]
+        self.frame_size = (width, height)
+        self.display_reader = self.capture.ring.reader("display")
+        self.detect_reader = self.capture.grey_ring.reader("detect")
+
+        # The last few seconds before 'r' is pressed, JPEG encoded and capped in bytes
+        self.preroll = PreRollBuffer(self.capture.ring.reader("preroll"),
+                                     seconds=preroll_seconds, max_bytes=32 * 1024 * 1024)
+
+        # Motion-triggered recording, checked on every grey frame at a small size
+        self.motion_reader = self.capture.grey_ring.reader("motion")
+        self.motion_detector = MotionDetector(width=160)
+        self.motion_trigger = MotionTrigger(min_area=0.01, keep_area=0.005, start_frames=3,
+                                            stop_seconds=3.0, cooldown=5.0)
+        self.motion_mode = False
+        self.motion_thread = None
+        self.motion_event = None  # "start"/"stop" for the main loop to act on
 
         # Initialize face detection
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = load_face_cascade()
         self.face_mode = False  # Toggle for face cropping mode
+        self.detect_scale = 2.0  # Detect on a downscaled frame, faces are at least 150 px
+        self.face_rect = None  # Latest face found by the detection thread
+        self.detect_thread = None
 
         # Initialize recording variables
         self.is_recording = False
         self.output_video = None
         self.face_video = None
+        self.face_track = None
+        self.face_size = (256, 256)  # Every face-track frame is resized to this
+        self.record_policy = "drop_oldest"  # What the writer does when its queue is full
         self.start_time = None
 
         # Create output directories
@@ -35,17 +80,23 @@ class CameraApp:
         for directory in [self.image_dir, self.video_dir, self.face_dir]:
             os.makedirs(directory, exist_ok=True)
 
+        # Instructions never change, so they are drawn once and blended onto each frame
+        self.overlay = StaticOverlay(self.draw_static_ui)
+        self.alloc_counter = None  # AllocationCounter when run with --count-allocs
+
         # Window names
         self.main_window = "Camera App"
         self.face_window = "Face View"
-        cv2.namedWindow(self.main_window)
-        cv2.namedWindow(self.face_window)
+        self.display.named_window(self.main_window)
+        self.display.named_window(self.face_window)
 
-    def detect_face(self, frame):
-        """Detect and return the largest face in the frame"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        faces = self.face_cascade.detectMultiScale(
+    @tracer.timed("detect.detectMultiScale")
+    def detect_face(self, gray):
+        """Detect and return the largest face in a single-channel grey frame"""
+        faces = detect_faces_scaled(
+            self.face_cascade,
             gray,
+            scale=self.detect_scale,
             scaleFactor=1.1,
             minNeighbors=5,
             minSize=(150, 150)
@@ -59,6 +110,52 @@ class CameraApp:
             return largest_face
         return None
 
+    def detect_loop(self):
+        """Detect faces on the newest captured frame, as often as detection allows"""
+        while self.face_mode:
+            # Grey frames come ready converted from the capture thread
+            gray = self.detect_reader.read(timeout=0.1)
+            if gray is None and self.detect_reader.closed():
+                break
+            if gray is not None:
+                self.face_rect = self.detect_face(gray)
+        self.face_rect = None
+
+    def set_face_mode(self, enabled):
+        """Start or stop the face detection thread"""
+        self.face_mode = enabled
+        if enabled:
+            self.detect_thread = threading.Thread(target=self.detect_loop, name="detect", daemon=True)
+            self.detect_thread.start()
+        elif self.detect_thread is not None:
+            self.detect_thread.join()
+            self.detect_thread = None
+
+    def motion_loop(self):
+        """Check every captured frame for motion and queue start/stop events"""
+        while self.motion_mode:
+            frame = self.motion_reader.read(timeout=0.1)
+            if frame is None and self.motion_reader.closed():
+                break
+            if frame is not None:
+                with tracer.stage("motion.detect"):
+                    fraction = self.motion_detector.detect(frame)
+                event = self.motion_trigger.update(fraction)
+                if event is not None:
+                    self.motion_event = event
+
+    def set_motion_mode(self, enabled):
+        """Start or stop the motion detection thread"""
+        self.motion_mode = enabled
+        if enabled:
+            self.motion_reader.skip_to_latest()
+            self.motion_thread = threading.Thread(target=self.motion_loop, name="motion", daemon=True)
+            self.motion_thread.start()
+        elif self.motion_thread is not None:
+            self.motion_thread.join()
+            self.motion_thread = None
+            self.motion_event = None
+
     def generate_filename(self, file_type, face=False):
         """Generate unique filename based on timestamp"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -69,6 +166,19 @@ class CameraApp:
             base_dir = self.face_dir if face else self.video_dir
             return os.path.join(base_dir, f"{'face' if face else 'video'}_{timestamp}.mp4")
 
+    def draw_static_ui(self, canvas):
+        """Draw the UI elements that never change, once, for the overlay"""
+        instructions = [
+            "Press 'r' to start/stop recording",
+            "Press 'c' to capture image",
+            "Press 'm' to toggle motion recording",
+            "Press 'f' to toggle face mode",
+            "Press 'q' to quit"
+        ]
+        for i, instruction in enumerate(instructions):
+            cv2.putText(canvas, instruction, (10, canvas.shape[0] - 20 - (i * 30)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
     def draw_ui(self, frame):
         """Draw UI elements on the frame"""
         # Add recording indicator
@@ -84,16 +194,13 @@ class CameraApp:
         cv2.putText(frame, face_status, (10, 70),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
-        # Add instructions
-        instructions = [
-            "Press 'r' to start/stop recording",
-            "Press 'c' to capture image",
-            "Press 'f' to toggle face mode",
-            "Press 'q' to quit"
-        ]
-        for i, instruction in enumerate(instructions):
-            cv2.putText(frame, instruction, (10, frame.shape[0] - 20 - (i * 30)),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        # Add motion mode indicator
+        if self.motion_mode:
+            cv2.putText(frame, "Motion: ON", (frame.shape[1] - 160, 40),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+        # Blend in the pre-rendered instructions
+        self.overlay.apply(frame)
 
         return frame
 
@@ -102,31 +209,73 @@ class CameraApp:
         filename = self.generate_filename("video")
         face_filename = self.generate_filename("video", face=True)
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        
-        self.output_video = cv2.VideoWriter(
-            filename, fourcc, 30.0, (1280, 720))
-        
-        # Initialize face video writer (will be updated with actual size when first face is detected)
-        self.face_video = None  # Will be initialized when first face is detected
-        
+        # A camera is written at the rate it actually delivers, not a nominal one. Files
+        # are decoded as fast as possible, so they keep their own frame rate.
+        fps = self.capture.fps() if self.source.live else self.source.fps
+        # One snapshot of the pre-roll for both files, so they stay frame for frame
+        preroll = self.preroll.frames(fps)
+
+        # Frames are written on a worker thread so a slow disk never blocks the preview
+        self.output_video = AsyncVideoWriter(
+            filename, fourcc, fps, self.frame_size, queue_size=60, policy=self.record_policy,
+            preroll=preroll)
+
+        # Face track: smoothed crops, all resized to the size fixed here. Its pre-roll is
+        # cropped at the face known now, or black if there is none yet.
+        self.face_track = FaceTrack(size=self.face_size)
+        face_rect = self.face_rect if self.face_mode else None
+        self.face_video = AsyncVideoWriter(
+            face_filename, fourcc, fps, self.face_size, queue_size=60,
+            policy=self.record_policy,
+            preroll=PreRollCrops(preroll, self.face_size, face_rect))
+
         self.is_recording = True
         self.start_time = time.time()
-        self.face_filename = face_filename  # Store filename for later initialization
+
+        # Every captured frame goes to the writer queues, straight from the capture thread
+        self.capture.add_sink(self.output_video.write)
+        self.capture.add_sink(self.write_face_track)
         print(f"Started recording: {filename}")
 
+    def write_face_track(self, frame):
+        """Write one smoothed face crop per captured frame, on the capture thread"""
+        self.face_track.update(self.face_rect if self.face_mode else None)
+        # Black until the first face, so the face video keeps one frame per captured frame
+        self.face_video.write(self.face_track.crop_or_blank(frame))
+
     def stop_recording(self):
         """Stop video recording"""
+        self.is_recording = False
         if self.output_video is not None:
+            self.capture.remove_sink(self.output_video.write)
+            # Flush everything still queued, then close the file
             self.output_video.release()
+            print(f"Video writer: {self.output_video.stats()}")
         if self.face_video is not None:
+            self.capture.remove_sink(self.write_face_track)
             self.face_video.release()
+            print(f"Face writer: {self.face_video.stats()}")
+            # No face was seen during the recording, don't leave a black file behind
+            if self.face_track.box is None and os.path.exists(self.face_video.filename):
+                os.remove(self.face_video.filename)
         self.is_recording = False
         self.output_video = None
         self.face_video = None
+        self.face_track = None
         print("Recording stopped")
 
-    def capture_image(self, frame, face_crop=None):
+    def capture_image(self):
         """Capture images - both full frame and face crop if available"""
+        # The display frame has the UI drawn on it, so save a clean copy from the ring
+        frame = self.capture.ring.snapshot()
+        if frame is None:
+            return
+        face_rect = self.face_rect if self.face_mode else None
+        face_crop = None
+        if face_rect is not None:
+            x, y, w, h = face_rect
+            face_crop = frame[y:y+h, x:x+w]
+
         # Save full frame
         filename = self.generate_filename("image")
         cv2.imwrite(filename, frame)
@@ -138,51 +287,74 @@ class CameraApp:
             cv2.imwrite(face_filename, face_crop)
             print(f"Face captured: {face_filename}")
 
+    def frame_stats(self):
+        """Frames captured, and frames read, dropped and stale for each consumer"""
+        stats = {"captured": self.capture.captured}
+        for reader in (self.display_reader, self.detect_reader, self.preroll.reader,
+                       self.motion_reader):
+            stats[reader.name] = reader.stats()
+        stats["preroll_buffer"] = self.preroll.stats()
+        stats["motion_detector"] = self.motion_detector.stats()
+        if self.alloc_counter is not None:
+            stats["allocations"] = self.alloc_counter.stats()
+        if self.output_video is not None:
+            stats["writer"] = self.output_video.stats()
+        return stats
+
     def run(self):
         """Main application loop"""
+        if self.alloc_counter is not None:
+            self.alloc_counter.start()
+            self.capture.alloc_counter = self.alloc_counter
+        self.capture.start()
+        self.preroll.start()
         try:
             while True:
-                # Capture frame
-                frame = self.picam2.capture_array()
-                frame = cv2.rotate(frame, cv2.ROTATE_180)
-                display_frame = frame.copy()
+                # Newest captured frame, copied into the display reader's own buffer,
+                # so the UI can be drawn straight on it
+                with tracer.stage("display.read"):
+                    frame = self.display_reader.read(timeout=0.1)
+                if frame is None and not self.capture.is_alive():
+                    print("End of frame source")
+                    break
                 face_crop = None
-                
-                # Detect face if face mode is on
-                if self.face_mode:
-                    face_rect = self.detect_face(frame)
+
+                if frame is not None:
+                    if self.alloc_counter is not None:
+                        self.alloc_counter.begin_frame("display")
+
+                    # Use the latest face found by the detection thread
+                    face_rect = self.face_rect if self.face_mode else None
                     if face_rect is not None:
                         x, y, w, h = face_rect
-                        # Draw rectangle on display frame
-                        cv2.rectangle(display_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        # Crop face
+                        # Crop face (a view, nothing is copied)
                         face_crop = frame[y:y+h, x:x+w]
-                        # Show face crop
-                        if face_crop is not None:
-                            cv2.imshow(self.face_window, face_crop)
-                            
-                            # Initialize face video writer if recording and not yet initialized
-                            if self.is_recording and self.face_video is None:
-                                h, w = face_crop.shape[:2]
-                                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                                self.face_video = cv2.VideoWriter(
-                                    self.face_filename, fourcc, 3, (w, h))
-                
-                # Draw UI on display frame
-                display_frame = self.draw_ui(display_frame)
-                
-                # Show main frame
-                cv2.imshow(self.main_window, display_frame)
-                
-                # Record frames
-                if self.is_recording:
-                    self.output_video.write(frame)  # Write full frame without UI
-                    if self.face_video is not None and face_crop is not None:
-                        self.face_video.write(face_crop)  # Write face crop
-                
+
+                    # Nothing is shown in headless mode, so skip the UI entirely
+                    if not self.display.headless:
+                        if face_rect is not None:
+                            # Show face crop
+                            with tracer.stage("display.imshow"):
+                                self.display.show(self.face_window, face_crop)
+                            # Draw rectangle straight on the reader's buffer
+                            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+
+                        # Draw UI on display frame
+                        with tracer.stage("display.draw"):
+                            display_frame = self.draw_ui(frame)
+
+                        # Show main frame
+                        with tracer.stage("display.imshow"):
+                            self.display.show(self.main_window, display_frame)
+
+                    if self.alloc_counter is not None:
+                        self.alloc_counter.end_frame("display")
+
                 # Handle key presses
-                key = cv2.waitKey(1) & 0xFF
-                
+                with tracer.stage("display.waitKey"):
+                    key = self.display.wait()
+                tracer.tick()
+
                 if key == ord('q'):
                     if self.is_recording:
                         self.stop_recording()
@@ -192,20 +364,63 @@ class CameraApp:
                         self.start_recording()
                     else:
                         self.stop_recording()
-                elif key == ord('c'):
-                    self.capture_image(frame, face_crop)
+                elif key == ord('m'):
+                    self.set_motion_mode(not self.motion_mode)
+
+                # Start or stop recording when the motion trigger fired
+                event, self.motion_event = self.motion_event, None
+                if event == "start" and not self.is_recording:
+                    self.start_recording()
+                elif event == "stop" and self.is_recording:
+                    self.stop_recording()
+
+                if key == ord('c'):
+                    self.capture_image()
                 elif key == ord('f'):
-                    self.face_mode = not self.face_mode
+                    self.set_face_mode(not self.face_mode)
                     if not self.face_mode:
-                        cv2.destroyWindow(self.face_window)
+                        self.display.destroy_window(self.face_window)
 
         finally:
             # Cleanup
             if self.is_recording:
                 self.stop_recording()
-            self.picam2.stop()
-            cv2.destroyAllWindows()
+            if self.face_mode:
+                self.set_face_mode(False)
+            if self.motion_mode:
+                self.set_motion_mode(False)
+            self.preroll.stop()
+            self.capture.stop()
+            self.source.release()
+            self.display.close()
+            if self.alloc_counter is not None:
+                self.alloc_counter.stop()
+            print(f"Frame stats: {self.frame_stats()}")
 
 if __name__ == "__main__":
-    app = CameraApp()
-    app.run()
\ No newline at end of file
+    parser = add_arguments(argparse.ArgumentParser(description="Camera app with face cropping"))
+    add_source_arguments(parser)
+    parser.add_argument('--motion', action='store_true',
+                        help="start in motion-triggered recording mode")
+    parser.add_argument('--preroll', type=float, default=3.0,
+                        help="seconds before 'r' is pressed to include in each recording")
+    parser.add_argument('--count-allocs', action='store_true',
+                        help="trace memory allocated by each frame of the main loop (slow)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args(args)
+    app = CameraApp(Display.from_args(args, delay=1),
+                    open_source(args.source, size=(1280, 720), format="RGB888",
+                                realtime=args.realtime),
+                    preroll_seconds=args.preroll)
+    if args.motion:
+        app.set_motion_mode(True)
+    if args.count_allocs:
+        app.alloc_counter = AllocationCounter()
+    try:
+        app.run()
+    finally:
+        if tracer.enabled:
+            print(tracer.format_summary())
+        if args.trace:
+            print(f"Wrote {tracer.export_trace(args.trace)} trace events to {args.trace}")
\ No newline at end of file
@@ -0,0 +1,157 @@
+#Cheap motion detection for motion-triggered recording.
+#MotionDetector shrinks each frame to a small grey image (160 px wide by default),
+#compares it with a running-average background (cv2.accumulateWeighted) and returns
+#the fraction of pixels that changed by more than a threshold. alpha=1.0 turns the
+#background into the previous frame, i.e. plain frame differencing. The small images
+#are preallocated, and the CPU time of each call is measured with time.thread_time()
+#so the cost per frame can be reported.
+#MotionTrigger turns the per-frame motion fraction into start/stop events with
+#hysteresis: recording starts after a few consecutive frames above min_area, keeps
+#going while motion stays above the lower keep_area, stops once there has been no
+#motion for stop_seconds, and cannot restart until cooldown seconds after a stop.
+#
+#   python motion.py task1.mp4
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionDetector:
+    def __init__(self, width=160, alpha=0.05, threshold=25, blur=5):
+        self.width = width
+        self.alpha = alpha
+        self.threshold = threshold
+        self.blur = blur
+        self._shape = None
+        self._background = None
+
+        # Stats
+        self.frames = 0
+        self.cpu_seconds = 0.0
+        self.max_cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def _allocate(self, frame):
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        self._small = np.empty((height, self.width) + frame.shape[2:], frame.dtype)
+        self._grey = np.empty((height, self.width), np.uint8)
+        self._diff = np.empty_like(self._grey)
+        self._background_u8 = np.empty_like(self._grey)
+        self._background = None
+        self._shape = frame.shape
+
+    def detect(self, frame):
+        """Return the fraction of the frame that moved since the background"""
+        start_cpu = time.thread_time()
+        start = time.perf_counter()
+
+        if frame.shape != self._shape:
+            self._allocate(frame)
+        small = cv2.resize(frame, (self.width, self._grey.shape[0]), dst=self._small,
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._grey)
+        else:
+            np.copyto(self._grey, small)
+        grey = cv2.GaussianBlur(self._grey, (self.blur, self.blur), 0, dst=self._grey)
+
+        if self._background is None:
+            self._background = grey.astype(np.float32)
+            fraction = 0.0
+        else:
+            cv2.convertScaleAbs(self._background, dst=self._background_u8)
+            cv2.absdiff(grey, self._background_u8, dst=self._diff)
+            cv2.threshold(self._diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self._diff)
+            fraction = cv2.countNonZero(self._diff) / self._diff.size
+            cv2.accumulateWeighted(grey, self._background, self.alpha)
+
+        cpu = time.thread_time() - start_cpu
+        self.frames += 1
+        self.cpu_seconds += cpu
+        self.max_cpu_seconds = max(self.max_cpu_seconds, cpu)
+        self.wall_seconds += time.perf_counter() - start
+        return fraction
+
+    def stats(self):
+        """Frames checked and the CPU (and wall) milliseconds each check cost"""
+        frames = max(1, self.frames)
+        return {"frames": self.frames,
+                "cpu_ms_per_frame": 1000 * self.cpu_seconds / frames,
+                "max_cpu_ms": 1000 * self.max_cpu_seconds,
+                "wall_ms_per_frame": 1000 * self.wall_seconds / frames}
+
+
+class MotionTrigger:
+    def __init__(self, min_area=0.01, keep_area=0.005, start_frames=3, stop_seconds=3.0,
+                 cooldown=5.0):
+        self.min_area = min_area
+        self.keep_area = keep_area
+        self.start_frames = start_frames
+        self.stop_seconds = stop_seconds
+        self.cooldown = cooldown
+
+        self.active = False
+        self.streak = 0  # consecutive frames above min_area while idle
+        self.last_motion = None
+        self.stopped_at = None
+        self.starts = 0
+        self.stops = 0
+
+    def update(self, fraction, now=None):
+        """Feed one frame's motion fraction. Returns "start", "stop" or None."""
+        now = time.time() if now is None else now
+        if self.active:
+            if fraction >= self.keep_area:
+                self.last_motion = now
+            elif now - self.last_motion >= self.stop_seconds:
+                self.active = False
+                self.stopped_at = now
+                self.streak = 0
+                self.stops += 1
+                return "stop"
+            return None
+
+        self.streak = self.streak + 1 if fraction >= self.min_area else 0
+        cooling = self.stopped_at is not None and now - self.stopped_at < self.cooldown
+        if self.streak >= self.start_frames and not cooling:
+            self.active = True
+            self.last_motion = now
+            self.starts += 1
+            return "start"
+        return None
+
+
+if __name__ == "__main__":
+    from video_pipeline import open_video
+
+    parser = argparse.ArgumentParser(description="Run the motion trigger over a video")
+    parser.add_argument("input")
+    parser.add_argument("--width", type=int, default=160)
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="background update rate, 1.0 for plain frame differencing")
+    parser.add_argument("--threshold", type=int, default=25)
+    parser.add_argument("--min-area", type=float, default=0.01)
+    args = parser.parse_args()
+
+    cap = open_video(args.input)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open video: {args.input}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    detector = MotionDetector(args.width, args.alpha, args.threshold)
+    trigger = MotionTrigger(min_area=args.min_area, keep_area=args.min_area / 2)
+
+    index = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # Use video time, so stop_seconds and cooldown mean the same as on the camera
+        event = trigger.update(detector.detect(frame), index / fps)
+        if event:
+            print(f"frame {index} ({index / fps:.2f} s): {event}")
+        index += 1
+    cap.release()
+    print(f"Motion detector: {detector.stats()}")
@@ -0,0 +1,45 @@
+#Static UI overlay that is drawn once and blended onto every display frame.
+#Text that never changes (key instructions and the like) is drawn by a callback onto a
+#black canvas the first time a frame of a given shape is seen. Only the bounding box
+#of what was drawn is kept, with per-pixel weights, and apply() blends that box into
+#the frame in place with cv2.blendLinear, so each frame costs one small blend and no
+#allocation instead of re-rendering every string.
+
+import cv2
+import numpy as np
+
+
+class StaticOverlay:
+    def __init__(self, draw, alpha=0.85, pad=4):
+        self.draw = draw  # draw(canvas) puts the static UI onto a black frame
+        self.alpha = alpha
+        self.pad = pad
+        self._shape = None
+
+    def _render(self, frame):
+        canvas = np.zeros_like(frame)
+        self.draw(canvas)
+        mask = canvas.max(axis=2) if canvas.ndim == 3 else canvas
+        x, y, w, h = cv2.boundingRect((mask > 0).astype(np.uint8))
+        if w == 0 or h == 0:
+            self._box = None
+        else:
+            # A little margin so anti-aliased edges blend into the frame
+            x0, y0 = max(0, x - self.pad), max(0, y - self.pad)
+            x1 = min(frame.shape[1], x + w + self.pad)
+            y1 = min(frame.shape[0], y + h + self.pad)
+            self._box = (slice(y0, y1), slice(x0, x1))
+            self._image = np.ascontiguousarray(canvas[self._box])
+            # Only the drawn pixels are blended, the rest of the box stays untouched
+            self._weights = (mask[self._box] > 0).astype(np.float32) * self.alpha
+            self._frame_weights = 1.0 - self._weights
+        self._shape = frame.shape
+
+    def apply(self, frame):
+        """Blend the overlay into frame in place and return it"""
+        if frame.shape != self._shape:
+            self._render(frame)
+        if self._box is not None:
+            roi = frame[self._box]
+            cv2.blendLinear(roi, self._image, self._frame_weights, self._weights, dst=roi)
+        return frame
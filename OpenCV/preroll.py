@@ -0,0 +1,123 @@
+#Rolling pre-event buffer for CameraApp recordings.
+#PreRollBuffer reads the newest frames from the capture ring on its own thread, JPEG
+#encodes them and keeps the last few seconds in memory. The buffer is capped both by
+#age and by total encoded bytes, oldest frames go first, so memory stays flat however
+#long the preview runs. When a recording starts, frames(fps) hands the buffered seconds
+#to AsyncVideoWriter, which writes them ahead of the live frames.
+#If encoding falls behind the camera the reader skips to the newest frame, so the
+#pre-roll may hold fewer frames per second than the recording, but never stalls capture.
+#Every frame keeps its capture time, and frames(fps) repeats or skips buffered frames
+#so the pre-roll plays back at the recording's frame rate instead of time-compressed.
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class PreRollFrames:
+    """Buffered frames in playback order, decoded one at a time while being iterated"""
+
+    def __init__(self, schedule):
+        self._schedule = schedule  # encoded frames, the same one repeated where needed
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def __iter__(self):
+        data = frame = None
+        for encoded in self._schedule:
+            if encoded is not data:
+                data, frame = encoded, cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+            yield frame
+
+
+class PreRollBuffer:
+    def __init__(self, reader, seconds=3.0, max_bytes=32 * 1024 * 1024, quality=90):
+        self.reader = reader
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+        self._frames = deque()  # (capture time, encoded frame), oldest first
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evicted = 0
+        self.encode_seconds = 0.0
+        self.encoded = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="preroll", daemon=True)
+
+    def start(self):
+        self.reader.skip_to_latest()
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            frame = self.reader.read(timeout=0.1)
+            if frame is None:
+                if self.reader.closed():
+                    break
+                continue
+            now = time.time()
+            start = time.perf_counter()
+            ok, data = cv2.imencode(".jpg", frame, self.params)
+            self.encode_seconds += time.perf_counter() - start
+            if not ok:
+                continue
+            self.encoded += 1
+
+            with self._lock:
+                self._frames.append((now, data))
+                self.bytes += data.nbytes
+                # Evict by size first, then anything older than the pre-roll window
+                while self._frames and (self.bytes > self.max_bytes
+                                        or self._frames[0][0] < now - self.seconds):
+                    _, old = self._frames.popleft()
+                    self.bytes -= old.nbytes
+                    self.evicted += 1
+
+    def frames(self, fps=None):
+        """Return the buffered frames, oldest first, as a PreRollFrames.
+
+        With fps, frame k is the one captured closest to k / fps seconds after the
+        first, so frames are repeated or skipped to match the output frame rate. The
+        buffer is snapshotted when this is called and decoded lazily, so only one
+        decoded frame is alive at a time while a writer consumes them.
+        """
+        with self._lock:
+            snapshot = list(self._frames)
+        if fps is None or len(snapshot) < 2:
+            return PreRollFrames([data for _, data in snapshot])
+        first = snapshot[0][0]
+        count = int(round((snapshot[-1][0] - first) * fps)) + 1
+        schedule = []
+        i = 0
+        for k in range(count):
+            due = first + (k + 0.5) / fps
+            while i + 1 < len(snapshot) and snapshot[i + 1][0] <= due:
+                i += 1
+            schedule.append(snapshot[i][1])
+        return PreRollFrames(schedule)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.bytes = 0
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def stats(self):
+        """Frames and bytes currently buffered, the time they span, and encode cost"""
+        with self._lock:
+            frames = len(self._frames)
+            span = self._frames[-1][0] - self._frames[0][0] if frames > 1 else 0.0
+            buffered = self.bytes
+        return {"frames": frames, "bytes": buffered, "seconds": span,
+                "evicted": self.evicted,
+                "mean_encode_ms": 1000 * self.encode_seconds / self.encoded if self.encoded else 0.0}
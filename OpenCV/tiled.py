@@ -0,0 +1,338 @@
+#Tiled processing of images too large to load, for the image_ops.py chains.
+#The image is cut into tiles that overlap their neighbours by a halo: the number of
+#pixels each step of the chain looks around an output pixel (7 for the 15x15
+#GaussianBlur, the sum over all steps of a chain). Each tile is read with its halo,
+#processed on a worker thread, and only its core, where the halo made every
+#neighbour available, is written out, so the result is exactly the whole-image
+#result. Tiles at the image edge have no halo on that side and get the same border
+#handling as the whole image would.
+#Canny is not local: hysteresis follows weak edges any distance from a strong one.
+#Tiles therefore only classify pixels as weak or strong edge candidates, then the
+#candidates are labelled strip by strip, components that cross strip seams are
+#joined, and every component holding a strong pixel becomes an edge.
+#.npy, .ppm and .pgm files are memory-mapped, so only the tiles being worked on are
+#in memory and the output streams to disk as tiles finish. Other formats have to be
+#decoded (or encoded) whole by OpenCV and lose that bound.
+#
+#   python tiled.py scan.ppm blurred.ppm --chain gaussian --tile 1024
+#   python tiled.py --synthetic 30000x30000 --chain edges
+#   python tiled.py --synthetic 6000x4000 --chain blue --verify
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_ops import CHAINS, Canny, OpChain, load_chain, make_test_image
+
+STREAMED_EXTENSIONS = (".npy", ".ppm", ".pgm")
+
+
+#------------------------------------------------#
+#   Rasters on disk
+#------------------------------------------------#
+
+class Raster:
+    """A uint8 image read and written one region at a time, in BGR channel order"""
+
+    def __init__(self, array, rgb=False, path=None):
+        self.array = array
+        self.rgb = rgb  # stored as RGB (PPM), swapped to BGR on the way in and out
+        self.path = path  # set when the image must be encoded whole on close()
+        self.shape = array.shape
+
+    def read(self, y0, y1, x0, x1):
+        tile = self.array[y0:y1, x0:x1]
+        if self.rgb:
+            return cv2.cvtColor(tile, cv2.COLOR_RGB2BGR)
+        return np.ascontiguousarray(tile)
+
+    def write(self, y0, x0, tile):
+        region = self.array[y0:y0 + tile.shape[0], x0:x0 + tile.shape[1]]
+        if self.rgb:
+            tile = cv2.cvtColor(tile, cv2.COLOR_BGR2RGB)
+        region[...] = tile
+
+    def close(self):
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+        elif self.path is not None:
+            cv2.imwrite(self.path, self.array)
+
+
+def _read_pnm_header(f):
+    """Read a binary PPM/PGM header, return (magic, width, height, data offset)"""
+    fields = []
+    while len(fields) < 4:
+        line = f.readline()
+        if not line:
+            raise ValueError("truncated PNM header")
+        fields += line.split(b"#")[0].split()
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic not in (b"P5", b"P6") or maxval != 255:
+        raise ValueError("only 8-bit binary PGM (P5) and PPM (P6) files can be streamed")
+    return magic, width, height, f.tell()
+
+
+def open_raster(path):
+    """Open an image for tiled reading, memory-mapped where the format allows"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return Raster(np.load(path, mmap_mode="r"))
+    if ext in (".ppm", ".pgm"):
+        with open(path, "rb") as f:
+            magic, width, height, offset = _read_pnm_header(f)
+        shape = (height, width, 3) if magic == b"P6" else (height, width)
+        return Raster(np.memmap(path, np.uint8, "r", offset, shape), rgb=magic == b"P6")
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise IOError(f"Could not read image: {path}")
+    return Raster(image)
+
+
+def create_raster(path, shape):
+    """Create an image for tiled writing, memory-mapped where the format allows"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return Raster(np.lib.format.open_memmap(path, "w+", np.uint8, shape))
+    if ext in (".ppm", ".pgm"):
+        if (ext == ".ppm") != (len(shape) == 3):
+            raise ValueError(f"{ext} needs a {'colour' if ext == '.ppm' else 'grey'} image")
+        header = f"{'P6' if ext == '.ppm' else 'P5'}\n{shape[1]} {shape[0]}\n255\n".encode()
+        with open(path, "wb") as f:
+            f.write(header)
+            f.truncate(len(header) + int(np.prod(shape)))
+        return Raster(np.memmap(path, np.uint8, "r+", len(header), shape), rgb=ext == ".ppm")
+    return Raster(np.empty(shape, np.uint8), path=path)
+
+
+#------------------------------------------------#
+#   Tiled execution
+#------------------------------------------------#
+
+def tiles(shape, tile):
+    """(y0, y1, x0, x1) of every tile, row by row"""
+    return [(y, min(y + tile, shape[0]), x, min(x + tile, shape[1]))
+            for y in range(0, shape[0], tile) for x in range(0, shape[1], tile)]
+
+
+class TiledChain:
+    def __init__(self, steps, tile=1024, workers=None):
+        """steps as for OpChain, with local operations only and at most a final canny"""
+        if isinstance(steps, str):
+            steps = CHAINS[steps]
+        steps = [dict(step) for step in steps]
+        self.tile = tile
+        self.workers = workers or os.cpu_count() or 1
+
+        self.canny = None
+        if steps and steps[-1]["op"] == "canny":
+            params = dict(steps.pop())
+            del params["op"]
+            self.canny = Canny(**params)
+        self.chain = OpChain(steps)
+        for name, op in self.chain.ops:
+            if op.halo is None or isinstance(op, Canny):
+                raise ValueError(f"'{name}' cannot run on tiles")
+        self.halo = sum(op.halo for _, op in self.chain.ops)
+        if self.canny is not None:
+            self.halo += self.canny.halo
+
+    def output_shape(self, shape):
+        for _, op in self.chain.ops:
+            shape = op.output_shape(shape)
+        return shape[:2] if self.canny is not None else shape
+
+    def _process(self, source, region):
+        """Run the local steps on one tile and its halo, return the core of the result"""
+        y0, y1, x0, x1 = region
+        height, width = source.shape[:2]
+        top, left = max(0, y0 - self.halo), max(0, x0 - self.halo)
+        tile = source.read(top, min(height, y1 + self.halo), left, min(width, x1 + self.halo))
+        result = self.chain.apply(tile) if self.chain.ops else tile
+        if self.canny is not None:
+            result = self._candidates(result)
+        return result[y0 - top:y1 - top, x0 - left:x1 - left]
+
+    def _candidates(self, image):
+        """0 for no edge, 1 for a weak edge candidate, 2 for a strong edge pixel.
+
+        With both thresholds equal Canny keeps exactly the pixels past non-maximum
+        suppression above that threshold, which is the candidate set of a normal run.
+        """
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        weak = cv2.Canny(image, self.canny.low, self.canny.low)
+        strong = cv2.Canny(image, self.canny.high, self.canny.high)
+        return (weak >> 7) + (strong >> 7)
+
+    def run(self, source, output):
+        """Process the Raster source into the Raster output, tile by tile"""
+        if self.canny is None:
+            self._run_tiles(source, output)
+            return
+        # Candidates go to a scratch file on disk, then hysteresis links them up
+        with tempfile.TemporaryDirectory(prefix="tiled_") as scratch_dir:
+            codes = Raster(np.lib.format.open_memmap(os.path.join(scratch_dir, "codes.npy"),
+                                                     "w+", np.uint8, source.shape[:2]))
+            self._run_tiles(source, codes)
+            self._hysteresis(codes, output)
+            del codes
+
+    def _run_tiles(self, source, output):
+        def work(region):
+            output.write(region[0], region[2], self._process(source, region))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for _ in pool.map(work, tiles(source.shape, self.tile)):
+                pass
+
+    def _strips(self, shape):
+        rows = max(16, self.tile * self.tile // shape[1])
+        return [(y, min(y + rows, shape[0])) for y in range(0, shape[0], rows)]
+
+    def _hysteresis(self, codes, output):
+        """Keep every 8-connected component of candidates that holds a strong pixel.
+
+        Components are labelled a strip at a time, numbered globally by offsetting
+        each strip's labels, and joined across each seam wherever a labelled pixel
+        touches one in the row above it (straight or diagonally).
+        """
+        strips = self._strips(codes.shape)
+        bases, strong_ids, pairs = [], [], []
+        total, previous_row = 0, None
+        for y0, y1 in strips:
+            strip = codes.read(y0, y1, 0, codes.shape[1])
+            count, labels = cv2.connectedComponents((strip > 0).view(np.uint8), connectivity=8,
+                                                    ltype=cv2.CV_32S)
+            base = total - 1  # local label l > 0 becomes global label base + l
+            labels = np.where(labels > 0, labels + base, -1)
+            bases.append(base)
+            strong_ids.append(np.unique(labels[strip == 2]))
+            if previous_row is not None:
+                pairs.extend(_seam_pairs(previous_row, labels[0]))
+            previous_row = labels[-1]
+            total += count - 1
+
+        root = _join(total, pairs)
+        strong_root = np.zeros(total, bool)
+        if strong_ids:
+            strong_root[root[np.concatenate(strong_ids)]] = True
+        keep = np.concatenate([[0], np.where(strong_root[root], 255, 0)]).astype(np.uint8)
+
+        def work(index):
+            y0, y1 = strips[index]
+            strip = codes.read(y0, y1, 0, codes.shape[1])
+            _, labels = cv2.connectedComponents((strip > 0).view(np.uint8), connectivity=8,
+                                                ltype=cv2.CV_32S)
+            # Labelling is deterministic, so the same strip gets the same labels again
+            labels[labels > 0] += bases[index] + 1
+            output.write(y0, 0, keep[labels])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for _ in pool.map(work, range(len(strips))):
+                pass
+
+
+def _seam_pairs(above, below):
+    """Global label pairs that touch across a seam, 8-connected"""
+    pairs = []
+    for shift in (-1, 0, 1):
+        a = above[max(0, shift):len(above) + min(0, shift)]
+        b = below[max(0, -shift):len(below) + min(0, -shift)]
+        touching = (a >= 0) & (b >= 0)
+        pairs.append(np.stack([a[touching], b[touching]], axis=1))
+    return pairs
+
+
+def _join(count, pairs):
+    """Union-find over count labels joined by pairs, returns each label's root"""
+    root = np.arange(count)
+    if not pairs:
+        return root
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        ra, rb = root[a], root[b]
+        if np.array_equal(ra, rb):
+            return root
+        # Hook the larger root of every pair under the smaller, then flatten the trees
+        low = np.minimum(ra, rb)
+        np.minimum.at(root, ra, low)
+        np.minimum.at(root, rb, low)
+        while True:
+            flat = root[root]
+            if np.array_equal(flat, root):
+                break
+            root = flat
+
+
+#------------------------------------------------#
+#   Synthetic scans
+#------------------------------------------------#
+
+def make_scan(path, size, seed=0, strip=1024):
+    """Write a large synthetic colour image a strip at a time"""
+    width, height = size
+    output = create_raster(path, (height, width, 3))
+    rng = np.random.default_rng(seed)
+    for y in range(0, height, strip):
+        rows = min(strip, height - y)
+        output.write(y, 0, make_test_image(rng, (width, max(rows, 128)))[:rows])
+    output.close()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an image_ops chain on a large image tile by tile")
+    parser.add_argument("input", nargs="?", default=None, help="image to process")
+    parser.add_argument("output", nargs="?", default=None,
+                        help="where to write the result (.npy, .ppm or .pgm stream to disk)")
+    parser.add_argument("--chain", default="gaussian",
+                        help=f"one of {', '.join(CHAINS)}, a JSON list of steps or a JSON file")
+    parser.add_argument("--tile", type=int, default=1024, help="tile side in pixels")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker threads (default: CPU count)")
+    parser.add_argument("--synthetic", default=None, metavar="WxH",
+                        help="process a generated image of this size instead of input")
+    parser.add_argument("--verify", action="store_true",
+                        help="compare with the chain run on the whole image (loads it whole)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tiled_cli_") as work_dir:
+        input_path = args.input
+        if args.synthetic:
+            size = tuple(int(v) for v in args.synthetic.split("x"))
+            input_path = make_scan(os.path.join(work_dir, "scan.ppm"), size)
+        elif input_path is None:
+            parser.error("give an input image or --synthetic WxH")
+
+        runner = TiledChain(load_chain(args.chain), args.tile, args.workers)
+        source = open_raster(input_path)
+        out_shape = runner.output_shape(source.shape)
+        output_path = args.output or os.path.join(work_dir, "out" + (".ppm" if len(out_shape) == 3 else ".pgm"))
+        output = create_raster(output_path, out_shape)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        runner.run(source, output)
+        output.close()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        megapixels = source.shape[0] * source.shape[1] / 1e6
+        print(f"{source.shape[1]}x{source.shape[0]} with {args.tile} px tiles and a {runner.halo} px "
+              f"halo in {seconds:.2f} s ({megapixels / seconds:.1f} MP/s), "
+              f"peak allocated {peak / 1e6:.1f} MB")
+
+        if args.verify:
+            whole = OpChain(load_chain(args.chain)).apply(cv2.imread(input_path))
+            result = open_raster(output_path).read(0, out_shape[0], 0, out_shape[1])
+            different = np.count_nonzero(result != whole)
+            print("identical to the whole-image result" if different == 0
+                  else f"{different} values differ from the whole-image result")
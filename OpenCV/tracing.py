@@ -0,0 +1,233 @@
+#Lightweight per-stage timing for the frame loops.
+#Wrap a piece of a loop in "with tracer.stage('name'):" or decorate a function with
+#@tracer.timed('name') (the my_decorator pattern from AdvancedPython/Functions.py, with
+#a timer before and after the call). While the tracer is disabled, stage() hands back
+#one shared do-nothing context manager and timed() wrappers call straight through, so
+#the instrumentation can stay in the hot path for well under a microsecond per use.
+#When enabled each stage keeps a histogram of its durations (buckets a quarter octave
+#wide, from 1 us to about 2 minutes), which is enough for p50/p99 without storing every
+#sample. With trace=True every stage call is also kept as a Chrome trace event, written
+#by export_trace() and viewed in chrome://tracing or https://ui.perfetto.dev.
+#tick() prints a text summary of every stage at most once every summary_interval
+#seconds, call it once per frame.
+#
+#   python tracing.py
+#measures the overhead of a disabled and an enabled stage.
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in nanoseconds, 4 per doubling from 1 us
+BUCKETS = [int(1000 * 2 ** (i / 4)) for i in range(4 * 27)]
+
+
+class _NullStage:
+    """Returned by stage() while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class StageHistogram:
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.counts[bisect.bisect_left(BUCKETS, ns)] += 1
+        self.calls += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in nanoseconds"""
+        if not self.calls:
+            return 0
+        target = p / 100 * self.calls
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(BUCKETS[i], self.max_ns) if i < len(BUCKETS) else self.max_ns
+        return self.max_ns
+
+    def summary(self):
+        calls = max(1, self.calls)
+        return {"calls": self.calls, "mean_ms": self.total_ns / calls / 1e6,
+                "p50_ms": self.percentile(50) / 1e6, "p99_ms": self.percentile(99) / 1e6,
+                "max_ms": self.max_ns / 1e6, "total_s": self.total_ns / 1e9}
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.max_events = 1_000_000  # a long trace is capped rather than eating memory
+        self.summary_interval = None
+        self.stages = {}
+        self.events = []
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._last_summary = time.perf_counter()
+
+    def configure(self, enabled=True, trace=False, summary_interval=None):
+        """Switch timing on or off, with Chrome trace events and/or periodic summaries"""
+        self.enabled = enabled
+        self.trace = enabled and trace
+        self.summary_interval = summary_interval
+        self._last_summary = time.perf_counter()
+
+    def stage(self, name):
+        """Context manager timing one stage, a no-op while disabled"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function as one stage"""
+        def decorator(func):
+            stage_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage_name, start, time.perf_counter_ns())
+            return wrapper
+        return decorator
+
+    def record(self, name, start_ns, end_ns):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageHistogram(name)
+            stage.add(end_ns - start_ns)
+            if self.trace and len(self.events) < self.max_events:
+                tid = threading.get_ident()
+                if tid not in self._thread_names:
+                    self._thread_names[tid] = threading.current_thread().name
+                self.events.append((name, start_ns, end_ns, tid))
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.events.clear()
+
+    def summary(self):
+        with self._lock:
+            return {name: stage.summary() for name, stage in sorted(self.stages.items())}
+
+    def format_summary(self):
+        lines = [f"{'stage':>24} {'calls':>7} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'total s':>8}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:>24} {s['calls']:7d} {s['mean_ms']:8.3f} {s['p50_ms']:8.3f} "
+                         f"{s['p99_ms']:8.3f} {s['max_ms']:8.3f} {s['total_s']:8.2f}")
+        return "\n".join(lines)
+
+    def tick(self):
+        """Print the summary if summary_interval seconds have passed since the last one"""
+        if not self.enabled or self.summary_interval is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_summary >= self.summary_interval:
+            self._last_summary = now
+            print(self.format_summary(), flush=True)
+
+    def export_trace(self, path):
+        """Write the recorded stage calls as a Chrome trace (JSON array format)"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            names = dict(self._thread_names)
+        trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": n}}
+                 for tid, n in names.items()]
+        trace += [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                   "ts": (start - self._origin) / 1000, "dur": (end - start) / 1000}
+                  for name, start, end, tid in events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+# Shared tracer that the frame loops are instrumented with
+tracer = Tracer()
+
+
+def add_arguments(parser):
+    """Add the --trace and --trace-summary options to an argparse parser"""
+    parser.add_argument('--trace', default=None, metavar="FILE",
+                        help="time every stage and write a Chrome trace to FILE on exit")
+    parser.add_argument('--trace-summary', type=float, default=None, metavar="SECONDS",
+                        help="time every stage and print a summary every SECONDS")
+    return parser
+
+
+def configure_from_args(args):
+    """Enable the shared tracer if --trace or --trace-summary was given"""
+    if args.trace or args.trace_summary:
+        tracer.configure(trace=bool(args.trace), summary_interval=args.trace_summary)
+
+
+if __name__ == "__main__":
+    calls = 1_000_000
+    bench = Tracer()
+
+    @bench.timed("decorated")
+    def work():
+        pass
+
+    def loop_overhead():
+        start = time.perf_counter()
+        for _ in range(calls):
+            pass
+        return time.perf_counter() - start
+
+    empty = loop_overhead()
+    for enabled in (False, True):
+        bench.configure(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(calls):
+            with bench.stage("stage"):
+                pass
+        stage_ns = (time.perf_counter() - start - empty) / calls * 1e9
+        start = time.perf_counter()
+        for _ in range(calls):
+            work()
+        decorated_ns = (time.perf_counter() - start - empty) / calls * 1e9
+        print(f"{'enabled' if enabled else 'disabled'}: with stage() {stage_ns:.0f} ns, "
+              f"@timed call {decorated_ns:.0f} ns")
@@ -0,0 +1,237 @@
+#Threaded decode -> transform -> encode pipeline for the Lab 6 video tasks.
+#cv2.VideoCapture.read, the per-frame transform and cv2.VideoWriter.write each run
+#as a separate stage connected by bounded queues, so a slow encoder no longer stalls
+#decoding. OpenCV releases the GIL inside these calls, so the stages overlap on
+#separate cores.
+
+import cv2
+import queue
+import threading
+import time
+
+from face_detection import load_face_cascade
+from frame_archive import FrameArchive, is_archive
+
+
+def open_video(path):
+    """Open a video file or a recorded frame archive for reading"""
+    if is_archive(path):
+        return FrameArchive(path)
+    return cv2.VideoCapture(path)
+
+# Sentinel pushed through the queues to mark the end of the stream
+_END = None
+
+
+#------------------------------------------------#
+#   Per-frame transforms shared by the Lab 6 tasks
+#------------------------------------------------#
+
+def grayscale(frame):
+    """Convert a BGR frame to a single-channel grey frame (Task 2)"""
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def gaussian_blur(frame):
+    """Apply the 15x15 Gaussian blur used in Task 4"""
+    return cv2.GaussianBlur(frame, (15, 15), 0)
+
+
+# One cascade per thread, since transform workers may run concurrently
+_cascades = threading.local()
+
+def detect_faces(frame):
+    """Draw a green box around every face found by the Task 7 Haar cascade"""
+    if not hasattr(_cascades, "face"):
+        _cascades.face = load_face_cascade()
+    grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    faces = _cascades.face.detectMultiScale(grey, scaleFactor=1.05, minNeighbors=5,
+                                            minSize=(60, 60))
+    for (x, y, w, h) in faces:
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    return frame
+
+
+#------------------------------------------------#
+#   Pipeline
+#------------------------------------------------#
+
+class StageStats:
+    """Frame count and busy time for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self._lock:
+            self.frames += 1
+            self.busy += elapsed
+
+    def fps(self):
+        """Frames per second of busy time, i.e. what one thread of this stage can sustain"""
+        return self.frames / self.busy if self.busy > 0 else 0.0
+
+
+class VideoPipeline:
+    def __init__(self, input_path, output_path, transform, is_color=True,
+                 workers=1, queue_size=32, fourcc='mp4v'):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.transform = transform
+        self.is_color = is_color
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.fourcc = fourcc
+        # Frames decoded but not yet written: both queues, the workers, and frames
+        # held back for reordering. One slow frame can't make the reorder dict grow
+        # past this, the reader waits instead.
+        self.max_in_flight = 2 * queue_size + self.workers
+        self.reached_end = False
+
+        self.read_stats = StageStats("read")
+        self.transform_stats = StageStats("transform")
+        self.write_stats = StageStats("write")
+        self.elapsed = 0.0
+
+        self._stop = threading.Event()
+        self._error = None
+        self._in_flight = threading.Semaphore(self.max_in_flight)
+        self._input_ended = False
+
+    def _read_loop(self, cap, read_q):
+        """Decode frames and queue them with their frame index"""
+        index = 0
+        try:
+            while not self._stop.is_set():
+                # Wait for the writer to catch up, checking for a stop now and then
+                if not self._in_flight.acquire(timeout=0.1):
+                    continue
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    self._input_ended = True
+                    break
+                self.read_stats.add(time.perf_counter() - start)
+                read_q.put((index, frame))
+                index += 1
+        except Exception as e:
+            # Raised again by run(), rather than looking like the end of the video
+            self._error = e
+            self._stop.set()
+        finally:
+            # One end marker per transform worker so that every worker exits
+            for _ in range(self.workers):
+                read_q.put(_END)
+
+    def _transform_loop(self, read_q, write_q):
+        """Apply the transform to queued frames, keeping the frame index attached"""
+        while True:
+            item = read_q.get()
+            if item is _END:
+                write_q.put(_END)
+                return
+            index, frame = item
+            if self._stop.is_set():
+                # Keep draining so the reader never blocks on a full queue
+                continue
+            try:
+                start = time.perf_counter()
+                result = self.transform(frame)
+                self.transform_stats.add(time.perf_counter() - start)
+            except Exception as e:
+                self._error = e
+                self._stop.set()
+                continue
+            write_q.put((index, result))
+
+    def run(self, preview=None):
+        """Run the pipeline to the end of the input and return the stage stats.
+
+        preview is called with every written frame on the calling thread and
+        should return False to stop early. reached_end tells the two apart.
+        """
+        cap = open_video(self.input_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video: {self.input_path}")
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+        out = cv2.VideoWriter(self.output_path, fourcc, fps, (width, height),
+                              isColor=self.is_color)
+
+        read_q = queue.Queue(maxsize=self.queue_size)
+        write_q = queue.Queue(maxsize=self.queue_size)
+        threads = [threading.Thread(target=self._read_loop, args=(cap, read_q), daemon=True)]
+        for _ in range(self.workers):
+            threads.append(threading.Thread(target=self._transform_loop,
+                                            args=(read_q, write_q), daemon=True))
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+
+        # The writer runs on the calling thread so that preview windows work.
+        # Frames from several workers can arrive out of order, so they are held
+        # until every earlier frame has been written.
+        pending = {}
+        next_index = 0
+        finished = 0
+        stopped = False
+        try:
+            while finished < self.workers:
+                item = write_q.get()
+                if item is _END:
+                    finished += 1
+                    continue
+                if self._stop.is_set():
+                    continue
+                index, frame = item
+                pending[index] = frame
+                while next_index in pending:
+                    frame = pending.pop(next_index)
+                    write_start = time.perf_counter()
+                    out.write(frame)
+                    self.write_stats.add(time.perf_counter() - write_start)
+                    self._in_flight.release()
+                    next_index += 1
+                    if preview is not None and preview(frame) is False:
+                        stopped = True
+                        self._stop.set()
+                        break
+        finally:
+            self._stop.set()
+            # Drain the output queue so no worker is left blocked on a full queue
+            while any(t.is_alive() for t in threads):
+                try:
+                    write_q.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            self.elapsed = time.perf_counter() - start
+            cap.release()
+            out.release()
+
+        if self._error is not None:
+            raise self._error
+        self.reached_end = self._input_ended and not stopped
+        return self.stats()
+
+    def stats(self):
+        """Return frames and frames/sec for each stage and for the whole run"""
+        stats = {}
+        for stage in (self.read_stats, self.transform_stats, self.write_stats):
+            stats[stage.name] = {"frames": stage.frames, "fps": stage.fps()}
+        frames = self.write_stats.frames
+        stats["total"] = {"frames": frames,
+                          "fps": frames / self.elapsed if self.elapsed > 0 else 0.0,
+                          "seconds": self.elapsed}
+        return stats
+
+    def print_stats(self):
+        """Print the per-stage throughput summary"""
+        for name, stage in self.stats().items():
+            print(f"{name:>9}: {stage['frames']} frames, {stage['fps']:.1f} fps")